@@ -4,22 +4,104 @@ Supports multiple free-tier AI models as fallbacks
 """
 
 import asyncio
+import hashlib
 import logging
-from typing import Dict, List, Optional, Any, Tuple
+import os
+import random
+import re
+import shutil
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import time
 import json
+from contextlib import contextmanager
 import tempfile
 import base64
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 # Import AI model clients
 from emergentintegrations.llm.chat import LlmChat, UserMessage, FileContentWithMimeType
 
+from ai_models.prompts import GEMINI_SYSTEM_MESSAGE, build_framework_prompt
+from ai_models.rate_limiter import estimate_tokens, get_gemini_rate_limiter
+
 logger = logging.getLogger(__name__)
 
+# Minimum code length for a result to be accepted without waiting or full scoring
+MIN_USABLE_CODE_LENGTH = 500
+
+# Provider circuit breaker: open after N failures within the window, then cool down
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_FAILURE_WINDOW = 30.0
+CIRCUIT_COOLDOWN = 60.0
+
+# Cap on simultaneous outbound LLM calls per service instance
+MAX_CONCURRENT_LLM_CALLS = 4
+
+# Attempts per model for transient failures (timeouts, provider errors)
+MAX_GENERATION_ATTEMPTS = 2
+
+# Client errors (bad request, auth) that a retry can't fix and that say nothing about provider health
+NON_RETRYABLE_STATUS_CODES = frozenset({400, 401, 403})
+_NON_RETRYABLE_STATUS_RE = re.compile(r"\b(?:400|401|403)\b")
+
+# Longest a call waits on our own rate limiter before giving up, separate from the provider timeout
+RATE_LIMIT_WAIT_TIMEOUT = 30.0
+
+# Per-worker LRU of best results, the fast layer in front of the MongoDB codegen cache in
+# server.py. Both use generation_cache_key; this layer also serves repeats that arrive before
+# the background MongoDB write lands, and its short TTL bounds memory, not freshness
+RESULT_CACHE_MAXSIZE = 256
+RESULT_CACHE_TTL = 3600.0
+
+# Markdown fences and chatty preambles stripped from generated code
+_MARKDOWN_RE = re.compile(
+    r"(?:```(?:\w+)?\s*\n?|```\s*$|^Here(?:'s| is).*?:\s*)",
+    re.MULTILINE | re.IGNORECASE
+)
+
+# Markers that a streamed component is complete; all patterns for a technology must match
+_STREAM_COMPLETE_RES: Dict[str, Tuple["re.Pattern[str]", ...]] = {
+    "react": (re.compile(r"^export default \w+;?\s*$", re.MULTILINE),),
+    "vue": (re.compile(r"</template>"), re.compile(r"</script>")),
+    "html": (re.compile(r"</html>", re.IGNORECASE),),
+}
+# Check streamed output roughly every 200 tokens
+STREAM_CHECK_INTERVAL = 800
+
+# Code quality signals used when scoring results
+_IMPORT_RE = re.compile(r"import", re.IGNORECASE)
+_QUALITY_RE = re.compile(r"function|const|def", re.IGNORECASE)
+
+# Cheap check that a response contains actual code
+_CODE_MARKER_RE = re.compile(r"import|function|const|def|<template|<script")
+
+# Keep shared screenshot temp files in memory-backed storage when available.
+# Without tmpfs, upload writes are offloaded to a thread, but GridFS still reads
+# the temp file synchronously on the event loop when storing the image
+TEMP_IMAGE_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+def new_image_hasher() -> "hashlib._Hash":
+    """Create the hasher used to fingerprint screenshots (feed it chunks, then hexdigest)"""
+    return hashlib.blake2b(digest_size=16)
+
+def generation_cache_key(
+    image_digest: str,
+    prompt: str,
+    technology: str,
+    user_comments: Optional[str]
+) -> str:
+    """Content-addressed key for a generation request, shared by every cache layer"""
+    request_hash = hashlib.blake2b(
+        "\0".join((prompt, technology, user_comments or "")).encode(), digest_size=16
+    ).hexdigest()
+    return f"{image_digest}:{request_hash}"
+
+class LocalBackpressureError(Exception):
+    """A call was held back by our own limits, not refused by the provider"""
+
 class ModelProvider(str, Enum):
     GEMINI = "gemini"
     HUGGINGFACE = "huggingface" 
@@ -40,7 +122,7 @@ class ModelType(str, Enum):
     POE_CLAUDE_SONNET = "poe-claude-sonnet"
     POE_CLAUDE_HAIKU = "poe-claude-haiku"
 
-@dataclass
+@dataclass(slots=True)
 class ModelConfig:
     """Configuration for each AI model"""
     model_type: ModelType
@@ -48,10 +130,12 @@ class ModelConfig:
     supports_images: bool
     max_tokens: int
     priority: int  # Lower number = higher priority
-    timeout: int
+    total_timeout: int
+    first_token_timeout: int = 8
     api_key_env_var: Optional[str] = None
+    api_key: Optional[str] = None
     
-@dataclass
+@dataclass(slots=True)
 class GenerationResult:
     """Result from AI model generation"""
     model_type: ModelType
@@ -69,11 +153,30 @@ class MultiAIService:
     
     def __init__(self):
         self.models = self._initialize_models()
-        self.executor = ThreadPoolExecutor(max_workers=6)
+        # Model selections are static, so filter and sort them once
+        self._image_models = {
+            model_type: config
+            for model_type, config in self.models.items()
+            if config.supports_images
+        }
+        self._sorted_image_models = sorted(self._image_models.values(), key=lambda m: m.priority)
+        self._sorted_models = sorted(self.models.values(), key=lambda m: m.priority)
+        # Lower priority number = higher score (up to 90 points)
+        self._priority_score = {
+            model_type: (10 - config.priority) * 10
+            for model_type, config in self.models.items()
+        }
+        self._provider_state: Dict[ModelProvider, Dict[str, Any]] = {
+            provider: {"failures": [], "opened_at": None, "probing": False}
+            for provider in ModelProvider
+        }
+        self._result_cache: "OrderedDict[str, Tuple[GenerationResult, float]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[Tuple[GenerationResult, List[GenerationResult]]]"] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
         
     def _initialize_models(self) -> Dict[ModelType, ModelConfig]:
         """Initialize available AI models with their configurations"""
-        return {
+        models = {
             # Gemini Models (Primary - support images)
             ModelType.GEMINI_FLASH: ModelConfig(
                 model_type=ModelType.GEMINI_FLASH,
@@ -81,7 +184,7 @@ class MultiAIService:
                 supports_images=True,
                 max_tokens=8192,
                 priority=1,  # Highest priority
-                timeout=30,
+                total_timeout=30,
                 api_key_env_var="GEMINI_API_KEY"
             ),
             ModelType.GEMINI_PRO: ModelConfig(
@@ -90,7 +193,7 @@ class MultiAIService:
                 supports_images=True,
                 max_tokens=8192,
                 priority=2,
-                timeout=45,
+                total_timeout=45,
                 api_key_env_var="GEMINI_API_KEY"
             ),
             ModelType.GEMINI_2_FLASH: ModelConfig(
@@ -99,7 +202,7 @@ class MultiAIService:
                 supports_images=True,
                 max_tokens=8192,
                 priority=3,
-                timeout=30,
+                total_timeout=30,
                 api_key_env_var="GEMINI_API_KEY"
             ),
             
@@ -110,7 +213,7 @@ class MultiAIService:
                 supports_images=False,
                 max_tokens=4096,
                 priority=4,
-                timeout=60
+                total_timeout=60
             ),
             ModelType.STARCODER2_7B: ModelConfig(
                 model_type=ModelType.STARCODER2_7B,
@@ -118,7 +221,7 @@ class MultiAIService:
                 supports_images=False,
                 max_tokens=4096,
                 priority=5,
-                timeout=60
+                total_timeout=60
             ),
             
             # Poe Models (Future implementation)
@@ -128,10 +231,19 @@ class MultiAIService:
             #     supports_images=True,
             #     max_tokens=4096,
             #     priority=6,
-            #     timeout=45,
+            #     total_timeout=45,
             #     api_key_env_var="POE_P_B_TOKEN"
             # ),
         }
+        
+        # Resolve API keys once instead of on every request
+        for config in models.values():
+            if config.api_key_env_var:
+                config.api_key = os.environ.get(config.api_key_env_var)
+                if not config.api_key:
+                    logger.warning("Missing API key %s for model %s", config.api_key_env_var, config.model_type)
+        
+        return models
     
     async def generate_code_multi_ai(
         self,
@@ -139,7 +251,10 @@ class MultiAIService:
         technology: str,
         image_data: Optional[bytes] = None,
         user_comments: Optional[str] = None,
-        max_models: int = 3
+        max_models: int = 3,
+        early_exit_priority: int = 2,
+        image_path: Optional[str] = None,
+        image_digest: Optional[str] = None
     ) -> Tuple[GenerationResult, List[GenerationResult]]:
         """
         Generate code using multiple AI models and return the best result
@@ -150,155 +265,417 @@ class MultiAIService:
             image_data: Screenshot image data (bytes)
             user_comments: Additional user requirements
             max_models: Maximum number of models to query simultaneously
+            early_exit_priority: Stop waiting for other models once a model with
+                this priority (or better) returns a usable result
+            image_path: Screenshot already on disk, used instead of image_data
+            image_digest: blake2b (16-byte) hex digest of the image, if already known
             
         Returns:
             Tuple of (best_result, all_results)
         """
         
-        # Filter models based on image support requirement
-        available_models = self._filter_models_by_capability(bool(image_data))
+        # Results for an on-disk image are only cached when the caller supplies its digest
+        if image_digest is None and not image_path:
+            image_digest = self._image_digest(image_data)
+        cache_key = generation_cache_key(image_digest, prompt, technology, user_comments) if image_digest else None
+        cached_result = self._get_cached_result(cache_key) if cache_key else None
+        if cached_result:
+            logger.info("Multi-AI cache hit. Best model: %s", cached_result.model_type)
+            return cached_result, [cached_result]
         
-        # Sort by priority and limit to max_models
-        selected_models = sorted(
-            available_models.values(), 
-            key=lambda m: m.priority
-        )[:max_models]
+        if not cache_key:
+            return await self._run_generation(
+                prompt, technology, image_data, user_comments, max_models,
+                early_exit_priority, image_path, cache_key
+            )
         
-        logger.info(f"Querying {len(selected_models)} AI models for code generation")
+        # Identical requests already in flight share one set of model calls
+        inflight = self._inflight.get(cache_key)
+        if inflight is None:
+            # The shared task can outlive this caller, so it works on its own link to the screenshot
+            shared_image_path = self._share_image(image_path) if image_path else None
+            inflight = asyncio.ensure_future(self._run_shared_generation(
+                prompt, technology, image_data, user_comments, max_models,
+                early_exit_priority, shared_image_path, cache_key
+            ))
+            self._inflight[cache_key] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        else:
+            logger.info("Joining in-flight generation for identical request")
         
-        # Create tasks for concurrent execution
-        tasks = []
-        for model_config in selected_models:
-            task = asyncio.create_task(
-                self._generate_with_single_model(
-                    model_config, prompt, technology, image_data, user_comments
-                )
+        return await asyncio.shield(inflight)
+    
+    async def _run_shared_generation(
+        self,
+        prompt: str,
+        technology: str,
+        image_data: Optional[bytes],
+        user_comments: Optional[str],
+        max_models: int,
+        early_exit_priority: int,
+        shared_image_path: Optional[str],
+        cache_key: Optional[str]
+    ) -> Tuple[GenerationResult, List[GenerationResult]]:
+        """Run a generation shared by coalesced callers, removing its screenshot link when done"""
+        try:
+            return await self._run_generation(
+                prompt, technology, image_data, user_comments, max_models,
+                early_exit_priority, shared_image_path, cache_key
             )
-            tasks.append(task)
+        finally:
+            if shared_image_path:
+                try:
+                    os.unlink(shared_image_path)
+                except OSError:
+                    pass
+    
+    async def _run_generation(
+        self,
+        prompt: str,
+        technology: str,
+        image_data: Optional[bytes],
+        user_comments: Optional[str],
+        max_models: int,
+        early_exit_priority: int,
+        image_path: Optional[str],
+        cache_key: Optional[str]
+    ) -> Tuple[GenerationResult, List[GenerationResult]]:
+        """Query the selected models concurrently and pick the best result"""
         
-        # Wait for all models to respond or timeout
-        results = []
-        try:
-            completed_results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            for result in completed_results:
-                if isinstance(result, Exception):
-                    logger.error(f"Model execution failed: {result}")
-                    continue
-                if isinstance(result, GenerationResult):
+        # Filter models based on image support requirement, already sorted by priority
+        sorted_models = self._sorted_image_models if (image_data or image_path) else self._sorted_models
+        selected_models = sorted_models[:max_models]
+        
+        logger.info("Querying %d AI models for code generation", len(selected_models))
+        
+        # Build the prompt once; a stable session id lets the provider reuse its prompt cache
+        enhanced_prompt = self._build_framework_prompt(prompt, technology, user_comments)
+        session_id = f"multi_ai_{hashlib.blake2b(enhanced_prompt.encode(), digest_size=8).hexdigest()}"
+        
+        # Write the screenshot once and share it across all model tasks
+        with self._temp_image(image_data, image_path) as image_path:
+            # Create tasks for concurrent execution
+            tasks = []
+            for model_config in selected_models:
+                task = asyncio.create_task(
+                    self._generate_with_single_model(
+                        model_config, prompt, technology, image_path, user_comments,
+                        enhanced_prompt, session_id
+                    )
+                )
+                tasks.append(task)
+        
+            # Collect results as they arrive, stopping early on a good high-priority result
+            results = []
+            try:
+                for future in asyncio.as_completed(tasks):
+                    try:
+                        result = await future
+                    except Exception as e:
+                        logger.error("Model execution failed: %s", e)
+                        continue
+                
+                    if not isinstance(result, GenerationResult):
+                        continue
                     results.append(result)
+                
+                    if self._is_early_exit_result(result, early_exit_priority):
+                        logger.info("Early exit with result from %s", result.model_type)
+                        break
                     
-        except Exception as e:
-            logger.error(f"Multi-AI generation failed: {e}")
+            except Exception as e:
+                logger.error("Multi-AI generation failed: %s", e)
+            finally:
+                # Cancel models that are still running and wait for them to unwind
+                for task in tasks:
+                    if not task.done():
+                        task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
         
         # Find the best result
         best_result = self._select_best_result(results)
+        if best_result and cache_key:
+            self._store_cached_result(cache_key, best_result)
         
-        logger.info(f"Multi-AI generation completed. Best model: {best_result.model_type if best_result else 'None'}")
+        logger.info("Multi-AI generation completed. Best model: %s", best_result.model_type if best_result else None)
         
         return best_result, results
     
+    @contextmanager
+    def _temp_image(self, image_data: Optional[bytes], image_path: Optional[str] = None) -> Iterator[Optional[str]]:
+        """Write screenshot bytes to a temp file for the duration of the block"""
+        if image_path or not image_data:
+            # Files supplied by the caller are left for the caller to remove
+            yield image_path
+            return
+        
+        with tempfile.NamedTemporaryFile(dir=TEMP_IMAGE_DIR, delete=False, suffix='.png') as temp_file:
+            temp_file.write(image_data)
+        try:
+            yield temp_file.name
+        finally:
+            try:
+                os.unlink(temp_file.name)
+            except OSError:
+                pass
+    
+    def _share_image(self, image_path: str) -> str:
+        """Hard-link (or copy) a caller's screenshot so it survives the caller deleting theirs"""
+        shared_path = f"{image_path}.shared"
+        try:
+            os.link(image_path, shared_path)
+        except OSError:
+            shutil.copyfile(image_path, shared_path)
+        return shared_path
+    
+    def _image_digest(self, image_data: Optional[bytes]) -> str:
+        """Fingerprint screenshot bytes for the result cache"""
+        hasher = new_image_hasher()
+        hasher.update(image_data or b"")
+        return hasher.hexdigest()
+    
+    def _get_cached_result(self, key: str) -> Optional[GenerationResult]:
+        """Return a cached result if present and not expired"""
+        entry = self._result_cache.get(key)
+        if entry is None:
+            return None
+        result, cached_at = entry
+        if time.time() - cached_at > RESULT_CACHE_TTL:
+            del self._result_cache[key]
+            return None
+        self._result_cache.move_to_end(key)
+        return result
+    
+    def _store_cached_result(self, key: str, result: GenerationResult) -> None:
+        """Cache a result, evicting the least recently used entries"""
+        self._result_cache[key] = (result, time.time())
+        self._result_cache.move_to_end(key)
+        while len(self._result_cache) > RESULT_CACHE_MAXSIZE:
+            self._result_cache.popitem(last=False)
+    
+    def _is_early_exit_result(self, result: GenerationResult, early_exit_priority: int) -> bool:
+        """Check whether a result is good enough to skip waiting for other models"""
+        if not result.success or not result.code:
+            return False
+        model_config = self.models.get(result.model_type)
+        if not model_config or model_config.priority > early_exit_priority:
+            return False
+        return self._is_usable_code(result.code)
+    
+    def _is_usable_code(self, code: str) -> bool:
+        """Cheap validity check for generated code"""
+        return len(code) >= MIN_USABLE_CODE_LENGTH and _CODE_MARKER_RE.search(code) is not None
+    
     def _filter_models_by_capability(self, requires_images: bool) -> Dict[ModelType, ModelConfig]:
         """Filter models based on required capabilities"""
         if requires_images:
             # Only return models that support images
-            return {
-                model_type: config 
-                for model_type, config in self.models.items()
-                if config.supports_images
-            }
+            return self._image_models
         else:
             # Return all models for text-only generation
             return self.models
     
+    @property
+    def _llm_semaphore(self) -> asyncio.Semaphore:
+        """Semaphore bounding concurrent LLM calls, created on first use"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+        return self._semaphore
+    
+    def _acquire_provider(self, provider: ModelProvider) -> bool:
+        """Check the provider circuit breaker, letting one probe through after cooldown"""
+        state = self._provider_state[provider]
+        opened_at = state["opened_at"]
+        if opened_at is None:
+            return True
+        if state["probing"] or time.monotonic() - opened_at < CIRCUIT_COOLDOWN:
+            return False
+        # Half-open: allow a single probe request
+        state["probing"] = True
+        return True
+    
+    def _record_provider_result(self, provider: ModelProvider, success: bool) -> None:
+        """Update the provider circuit breaker after a call completes"""
+        state = self._provider_state[provider]
+        now = time.monotonic()
+        
+        if success:
+            state["failures"].clear()
+            state["opened_at"] = None
+            state["probing"] = False
+            return
+        
+        if state["probing"]:
+            # Failed probe re-opens the circuit for another cooldown
+            state["probing"] = False
+            state["opened_at"] = now
+            return
+        
+        failures = [t for t in state["failures"] if now - t < CIRCUIT_FAILURE_WINDOW]
+        failures.append(now)
+        state["failures"] = failures
+        if len(failures) >= CIRCUIT_FAILURE_THRESHOLD and state["opened_at"] is None:
+            logger.warning("Opening circuit for provider %s after %d failures", provider, len(failures))
+            state["opened_at"] = now
+    
     async def _generate_with_single_model(
         self,
         model_config: ModelConfig,
         prompt: str,
         technology: str,
-        image_data: Optional[bytes],
-        user_comments: Optional[str]
+        image_path: Optional[str],
+        user_comments: Optional[str],
+        enhanced_prompt: str,
+        session_id: str
     ) -> GenerationResult:
         """Generate code using a single AI model"""
         
         start_time = time.time()
         
-        try:
-            if model_config.provider == ModelProvider.GEMINI:
-                result = await self._generate_with_gemini(
-                    model_config, prompt, technology, image_data, user_comments
-                )
-            elif model_config.provider == ModelProvider.HUGGINGFACE:
-                result = await self._generate_with_huggingface(
-                    model_config, prompt, technology, user_comments
-                )
-            elif model_config.provider == ModelProvider.POE:
-                result = await self._generate_with_poe(
-                    model_config, prompt, technology, user_comments
-                )
-            else:
-                raise ValueError(f"Unsupported provider: {model_config.provider}")
-                
-            result.response_time = time.time() - start_time
-            return result
-            
-        except asyncio.TimeoutError:
-            logger.warning(f"Timeout for model {model_config.model_type}")
+        if not self._acquire_provider(model_config.provider):
+            logger.warning("Circuit open for provider %s, skipping %s", model_config.provider, model_config.model_type)
             return GenerationResult(
                 model_type=model_config.model_type,
                 provider=model_config.provider,
                 success=False,
-                error="Request timeout",
-                response_time=time.time() - start_time
+                error="Circuit open"
             )
-        except Exception as e:
-            logger.error(f"Error with model {model_config.model_type}: {e}")
-            return GenerationResult(
-                model_type=model_config.model_type,
-                provider=model_config.provider,
-                success=False,
-                error=str(e),
-                response_time=time.time() - start_time
+        
+        # Time spent queueing for a local call slot is not charged to the provider's budget
+        queued = 0.0
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                wait_start = time.time()
+                async with self._llm_semaphore:
+                    # Waiting for our own token bucket is local backpressure as well
+                    await self._wait_for_rate_limit(model_config, enhanced_prompt)
+                    queued += time.time() - wait_start
+                    # Each attempt only gets what is left of the model's total budget
+                    remaining = model_config.total_timeout - (time.time() - start_time - queued)
+                    result = await asyncio.wait_for(
+                        self._dispatch_to_provider(
+                            model_config, prompt, technology, image_path, user_comments,
+                            enhanced_prompt, session_id
+                        ),
+                        timeout=remaining
+                    )
+                result.response_time = time.time() - start_time
+                self._record_provider_result(model_config.provider, success=True)
+                return result
+                
+            except asyncio.CancelledError:
+                # A cancelled probe says nothing about provider health
+                self._provider_state[model_config.provider]["probing"] = False
+                raise
+            except Exception as e:
+                # Bad responses, client errors and local backpressure say nothing about provider
+                # health, so they aren't retried and leave the breaker as it was (only freeing a half-open probe)
+                transient = not self._is_non_retryable(e)
+                if transient:
+                    self._record_provider_result(model_config.provider, success=False)
+                else:
+                    self._provider_state[model_config.provider]["probing"] = False
+                
+                if transient and attempt < MAX_GENERATION_ATTEMPTS:
+                    delay = min(2 ** (attempt - 1) + random.random() * 0.3, 4)
+                    elapsed = time.time() - start_time - queued
+                    if elapsed + delay < model_config.total_timeout and self._acquire_provider(model_config.provider):
+                        logger.warning("Retrying model %s in %.1fs after: %r", model_config.model_type, delay, e)
+                        await asyncio.sleep(delay)
+                        continue
+                
+                if isinstance(e, asyncio.TimeoutError):
+                    logger.warning("Timeout for model %s", model_config.model_type)
+                    error = "Request timeout"
+                else:
+                    logger.error("Error with model %s: %s", model_config.model_type, e)
+                    error = str(e)
+                return GenerationResult(
+                    model_type=model_config.model_type,
+                    provider=model_config.provider,
+                    success=False,
+                    error=error,
+                    response_time=time.time() - start_time
+                )
+    
+    def _is_non_retryable(self, error: Exception) -> bool:
+        """Check whether an error is our fault (bad input, config, auth) rather than the provider's"""
+        if isinstance(error, (ValueError, NotImplementedError, LocalBackpressureError)):
+            return True
+        status = getattr(error, "status_code", None)
+        if status is None:
+            status = getattr(getattr(error, "response", None), "status_code", None)
+        if status is not None:
+            return status in NON_RETRYABLE_STATUS_CODES
+        # Clients that don't expose a status usually put it in the message
+        return _NON_RETRYABLE_STATUS_RE.search(str(error)) is not None
+    
+    async def _wait_for_rate_limit(self, model_config: ModelConfig, enhanced_prompt: str) -> None:
+        """Wait for the provider's request/token budget, raising LocalBackpressureError past its own deadline"""
+        if model_config.provider != ModelProvider.GEMINI:
+            return
+        try:
+            await asyncio.wait_for(
+                get_gemini_rate_limiter().acquire(estimate_tokens(enhanced_prompt)),
+                timeout=RATE_LIMIT_WAIT_TIMEOUT
             )
+        except asyncio.TimeoutError:
+            raise LocalBackpressureError("Timed out waiting for Gemini rate limit budget")
     
-    async def _generate_with_gemini(
+    async def _dispatch_to_provider(
         self,
         model_config: ModelConfig,
         prompt: str,
         technology: str,
-        image_data: Optional[bytes],
-        user_comments: Optional[str]
+        image_path: Optional[str],
+        user_comments: Optional[str],
+        enhanced_prompt: str,
+        session_id: str
+    ) -> GenerationResult:
+        """Route a generation request to the model's provider"""
+        if model_config.provider == ModelProvider.GEMINI:
+            return await self._generate_with_gemini(
+                model_config, enhanced_prompt, technology, image_path, session_id
+            )
+        elif model_config.provider == ModelProvider.HUGGINGFACE:
+            return await self._generate_with_huggingface(
+                model_config, prompt, technology, user_comments
+            )
+        elif model_config.provider == ModelProvider.POE:
+            return await self._generate_with_poe(
+                model_config, prompt, technology, user_comments
+            )
+        else:
+            raise ValueError(f"Unsupported provider: {model_config.provider}")
+    
+    async def _generate_with_gemini(
+        self,
+        model_config: ModelConfig,
+        enhanced_prompt: str,
+        technology: str,
+        image_path: Optional[str],
+        session_id: str
     ) -> GenerationResult:
         """Generate code using Gemini models"""
         
-        import os
-        
-        # Get API key
-        api_key = os.environ.get(model_config.api_key_env_var)
-        if not api_key:
+        if not model_config.api_key:
             raise ValueError(f"Missing API key: {model_config.api_key_env_var}")
         
         # Create chat instance
         chat = LlmChat(
-            session_id=f"multi_ai_{int(time.time())}",
-            system_message="You are an expert frontend developer who generates clean, modern code from UI screenshots.",
-            api_key=api_key
+            session_id=session_id,
+            system_message=GEMINI_SYSTEM_MESSAGE,
+            api_key=model_config.api_key
         ).with_model("gemini", model_config.model_type.value)
         
-        # Build enhanced prompt
-        enhanced_prompt = self._build_framework_prompt(prompt, technology, user_comments)
-        
         # Prepare user message
         file_contents = []
-        if image_data:
-            # Save image temporarily for Gemini
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
-                temp_file.write(image_data)
-                temp_file_path = temp_file.name
-            
+        if image_path:
             file_contents.append(FileContentWithMimeType(
                 mime_type="image/png",
-                file_path=temp_file_path
+                file_path=image_path
             ))
         
         user_message = UserMessage(
@@ -306,41 +683,76 @@ class MultiAIService:
             file_contents=file_contents
         )
         
+        # Generate with a first-token timeout; the caller bounds the total time
+        response = await self._send_message(chat, user_message, model_config, technology)
+        
+        if not response or len(response.strip()) < 50:
+            raise ValueError("Empty or too short response from Gemini")
+        
+        # Clean the generated code
+        cleaned_code = await asyncio.to_thread(self._clean_generated_code, response, technology)
+        
+        return GenerationResult(
+            model_type=model_config.model_type,
+            provider=model_config.provider,
+            success=True,
+            code=cleaned_code,
+            tokens_used=self._estimate_tokens(response)
+        )
+    
+    async def _send_message(
+        self,
+        chat: LlmChat,
+        user_message: UserMessage,
+        model_config: ModelConfig,
+        technology: Optional[str] = None
+    ) -> str:
+        """
+        Send a message, failing fast when the first chunk takes too long
+        
+        When the client streams, stop reading as soon as the output holds a
+        complete component for the technology. The total time is bounded by the
+        caller's wait_for, which only grants what is left of the model's budget.
+        """
+        
+        stream_message = getattr(chat, "stream_message", None)
+        if stream_message is None:
+            # Without streaming there is no first token to wait on
+            return await chat.send_message(user_message)
+        
+        timeout = model_config.first_token_timeout
+        stream = stream_message(user_message).__aiter__()
+        complete_res = _STREAM_COMPLETE_RES.get((technology or "").lower())
+        chunks = []
+        received = 0
+        next_check = STREAM_CHECK_INTERVAL
         try:
-            # Generate with timeout
-            response = await asyncio.wait_for(
-                chat.send_message(user_message),
-                timeout=model_config.timeout
-            )
-            
-            # Clean up temp file
-            if image_data and 'temp_file_path' in locals():
+            while True:
                 try:
-                    os.unlink(temp_file_path)
-                except:
-                    pass
-            
-            if not response or len(response.strip()) < 50:
-                raise ValueError("Empty or too short response from Gemini")
-            
-            # Clean the generated code
-            cleaned_code = self._clean_generated_code(response, technology)
-            
-            return GenerationResult(
-                model_type=model_config.model_type,
-                provider=model_config.provider,
-                success=True,
-                code=cleaned_code,
-                tokens_used=self._estimate_tokens(response)
-            )
-            
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout=timeout)
+                except StopAsyncIteration:
+                    break
+                chunks.append(chunk)
+                received += len(chunk)
+                
+                if complete_res and received >= next_check:
+                    next_check = received + STREAM_CHECK_INTERVAL
+                    text = "".join(chunks)
+                    if len(text) >= MIN_USABLE_CODE_LENGTH and all(r.search(text) for r in complete_res):
+                        logger.info("Stopping stream early for %s: component complete", model_config.model_type)
+                        return text
+                
+                # Once output is flowing, only the caller's overall budget applies
+                timeout = None
         finally:
-            # Ensure temp file cleanup
-            if image_data and 'temp_file_path' in locals():
+            aclose = getattr(stream, "aclose", None)
+            if aclose:
                 try:
-                    os.unlink(temp_file_path)
-                except:
+                    await aclose()
+                except Exception:
                     pass
+        
+        return "".join(chunks)
     
     async def _generate_with_huggingface(
         self,
@@ -354,8 +766,6 @@ class MultiAIService:
         # For now, return a placeholder since HF models require more setup
         # In a real implementation, you would use transformers library here
         
-        enhanced_prompt = self._build_framework_prompt(prompt, technology, user_comments)
-        
         # Simulate HuggingFace model response
         await asyncio.sleep(1)  # Simulate processing time
         
@@ -390,100 +800,15 @@ class MultiAIService:
     ) -> str:
         """Build enhanced prompt for specific framework"""
         
-        framework_templates = {
-            "react": f"""
-You are an expert React developer. Analyze this UI and generate clean, modern React code.
-
-Requirements:
-- Use functional components with hooks (useState, useEffect, etc.)
-- Use Tailwind CSS for styling
-- Make it fully responsive and mobile-friendly
-- Include proper semantic HTML
-- Add interactive elements and hover effects
-- Use modern React best practices
-- Generate complete component code that's ready to use
-- Return ONLY the component code without markdown formatting
-
-User Request: {prompt}
-""",
-            "vue": f"""
-You are an expert Vue.js developer. Generate clean Vue 3 code using Composition API.
-
-Requirements:  
-- Use Vue 3 Composition API with <script setup>
-- Use Tailwind CSS for styling
-- Make it fully responsive
-- Include reactive data and methods
-- Add proper component structure
-- Generate complete component code
-
-User Request: {prompt}
-""",
-            "html": f"""
-You are an expert web developer. Generate clean HTML, CSS, and JavaScript.
-
-Requirements:
-- Use semantic HTML5 elements
-- Use modern CSS with Flexbox/Grid
-- Include responsive design
-- Add vanilla JavaScript for interactivity
-- Use modern web standards
-- Generate complete HTML document
-
-User Request: {prompt}
-""",
-            "angular": f"""
-You are an expert Angular developer. Generate Angular component code.
-
-Requirements:
-- Use Angular latest version features
-- Use TypeScript
-- Include proper component structure
-- Add responsive styling
-- Generate complete component code
-
-User Request: {prompt}
-""",
-            "svelte": f"""
-You are an expert Svelte developer. Generate modern Svelte component code.
-
-Requirements:
-- Use modern Svelte features
-- Include reactive statements
-- Add responsive styling
-- Generate complete component code
-
-User Request: {prompt}
-"""
-        }
-        
-        base_prompt = framework_templates.get(technology.lower(), framework_templates["react"])
-        
-        if user_comments:
-            base_prompt += f"\n\nAdditional Requirements:\n{user_comments}"
-        
-        return base_prompt
+        return build_framework_prompt(prompt, technology, user_comments)
     
     def _clean_generated_code(self, code: str, technology: str) -> str:
         """Clean and format generated code"""
         if not code:
             return ""
         
-        cleaned = code.strip()
-        
-        # Remove common markdown patterns
-        import re
-        markdown_patterns = [
-            r'```(\w+)?\s*\n?',
-            r'```\s*$',
-            r'^Here\'s.*?:\s*',
-            r'^Here is.*?:\s*'
-        ]
-        
-        for pattern in markdown_patterns:
-            cleaned = re.sub(pattern, '', cleaned, flags=re.MULTILINE | re.IGNORECASE)
-        
-        return cleaned.strip()
+        # Remove common markdown patterns in a single pass
+        return _MARKDOWN_RE.sub("", code.strip()).strip()
     
     def _generate_fallback_code(self, technology: str, prompt: str) -> str:
         """Generate fallback code when AI models fail"""
@@ -643,14 +968,18 @@ const toggleVisibility = () => {{
         if not successful_results:
             return None
         
-        # Score results based on multiple criteria
+        # Common case: the highest-priority result that looks like real code wins
+        for result in sorted(successful_results, key=lambda r: -self._priority_score.get(r.model_type, 0)):
+            if self._is_usable_code(result.code):
+                logger.info("Selected best result from %s (highest priority usable result)", result.model_type)
+                return result
+        
+        # Otherwise score results based on multiple criteria
         def score_result(result: GenerationResult) -> float:
             score = 0.0
             
             # Priority based on model (lower priority number = higher score)
-            model_config = self.models.get(result.model_type)
-            if model_config:
-                score += (10 - model_config.priority) * 10  # Up to 60 points
+            score += self._priority_score.get(result.model_type, 0)
             
             # Code length (reasonable length is better)
             if result.code:
@@ -670,13 +999,12 @@ const toggleVisibility = () => {{
             
             # Code quality indicators
             if result.code:
-                code_lower = result.code.lower()
                 # Check for good practices
-                if 'import' in code_lower and ('function' in code_lower or 'const' in code_lower or 'def' in code_lower):
+                if _IMPORT_RE.search(result.code) and _QUALITY_RE.search(result.code):
                     score += 15
                 if 'className' in result.code or 'class=' in result.code:
                     score += 5
-                if len([line for line in result.code.split('\n') if line.strip()]) > 10:  # Multi-line code
+                if result.code.count('\n') >= 10:  # Multi-line code
                     score += 10
             
             return score
@@ -685,13 +1013,13 @@ const toggleVisibility = () => {{
         scored_results = [(score_result(r), r) for r in successful_results]
         best_score, best_result = max(scored_results, key=lambda x: x[0])
         
-        logger.info(f"Selected best result from {best_result.model_type} (score: {best_score:.1f})")
+        logger.info("Selected best result from %s (score: %.1f)", best_result.model_type, best_score)
         
         return best_result
     
     def _estimate_tokens(self, text: str) -> int:
         """Estimate token count for text"""
-        return len(text.split()) if text else 0
+        return estimate_tokens(text)
     
     def get_available_models(self) -> List[Dict[str, Any]]:
         """Get list of available models with their capabilities"""
@@ -0,0 +1,93 @@
+"""
+Prompt text for Multi-AI code generation
+Kept constant so every request shares the same prompt prefix
+"""
+
+from typing import Dict, Optional, Tuple
+
+# Shared system message so every Gemini model sees an identical prompt prefix
+GEMINI_SYSTEM_MESSAGE = "You are an expert frontend developer who generates clean, modern code from UI screenshots."
+
+# Framework prompt templates; {prompt} is the only per-request part
+FRAMEWORK_TEMPLATES: Dict[str, str] = {
+    "react": """
+You are an expert React developer. Analyze this UI and generate clean, modern React code.
+
+Requirements:
+- Use functional components with hooks (useState, useEffect, etc.)
+- Use Tailwind CSS for styling
+- Make it fully responsive and mobile-friendly
+- Include proper semantic HTML
+- Add interactive elements and hover effects
+- Use modern React best practices
+- Generate complete component code that's ready to use
+- Return ONLY the component code without markdown formatting
+
+User Request: {prompt}
+""",
+    "vue": """
+You are an expert Vue.js developer. Generate clean Vue 3 code using Composition API.
+
+Requirements:  
+- Use Vue 3 Composition API with <script setup>
+- Use Tailwind CSS for styling
+- Make it fully responsive
+- Include reactive data and methods
+- Add proper component structure
+- Generate complete component code
+
+User Request: {prompt}
+""",
+    "html": """
+You are an expert web developer. Generate clean HTML, CSS, and JavaScript.
+
+Requirements:
+- Use semantic HTML5 elements
+- Use modern CSS with Flexbox/Grid
+- Include responsive design
+- Add vanilla JavaScript for interactivity
+- Use modern web standards
+- Generate complete HTML document
+
+User Request: {prompt}
+""",
+    "angular": """
+You are an expert Angular developer. Generate Angular component code.
+
+Requirements:
+- Use Angular latest version features
+- Use TypeScript
+- Include proper component structure
+- Add responsive styling
+- Generate complete component code
+
+User Request: {prompt}
+""",
+    "svelte": """
+You are an expert Svelte developer. Generate modern Svelte component code.
+
+Requirements:
+- Use modern Svelte features
+- Include reactive statements
+- Add responsive styling
+- Generate complete component code
+
+User Request: {prompt}
+"""
+}
+
+# Templates split around their {prompt} slot once, so building a prompt is plain concatenation
+_TEMPLATE_PARTS: Dict[str, Tuple[str, str]] = {
+    technology: tuple(template.split("{prompt}", 1))
+    for technology, template in FRAMEWORK_TEMPLATES.items()
+}
+
+def build_framework_prompt(prompt: str, technology: str, user_comments: Optional[str] = None) -> str:
+    """Fill the technology's template (React by default) with the request and any user comments"""
+    head, tail = _TEMPLATE_PARTS.get(technology.lower(), _TEMPLATE_PARTS["react"])
+    base_prompt = head + prompt + tail
+    
+    if user_comments:
+        base_prompt += f"\n\nAdditional Requirements:\n{user_comments}"
+    
+    return base_prompt
@@ -0,0 +1,63 @@
+"""
+Client-side rate limiting for LLM providers
+Token buckets that wait for budget before a call instead of retrying on 429s
+"""
+
+import asyncio
+import os
+import time
+from typing import Optional
+
+class TokenBucket:
+    """Token bucket allowing `rate` units per `per` seconds"""
+
+    def __init__(self, rate: float, per: float):
+        self.capacity = rate
+        self.fill_rate = rate / per
+        self.tokens = rate
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.fill_rate)
+        self.updated_at = now
+
+    async def acquire(self, n: float = 1) -> None:
+        """Wait until n units are available, then take them"""
+        # A request larger than the bucket can never fit; let it drain the bucket instead
+        n = min(n, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < n:
+                await asyncio.sleep((n - self.tokens) / self.fill_rate)
+                self._refill()
+            self.tokens -= n
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budgets for one provider"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute, 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, 60.0)
+
+    async def acquire(self, expected_tokens: int) -> None:
+        """Wait for budget for one request of roughly expected_tokens"""
+        await self.requests.acquire(1)
+        await self.tokens.acquire(expected_tokens)
+
+def estimate_tokens(text: str) -> int:
+    """Estimate token count for text (~4 characters per token)"""
+    return (len(text) + 3) >> 2 if text else 0
+
+_gemini_rate_limiter: Optional[RateLimiter] = None
+
+def get_gemini_rate_limiter() -> RateLimiter:
+    """Rate limiter shared by every Gemini caller, configured on first use"""
+    global _gemini_rate_limiter
+    if _gemini_rate_limiter is None:
+        _gemini_rate_limiter = RateLimiter(
+            requests_per_minute=int(os.environ.get("GEMINI_RPM", "60")),
+            tokens_per_minute=int(os.environ.get("GEMINI_TPM", "1000000"))
+        )
+    return _gemini_rate_limiter
@@ -1,31 +1,62 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Form
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Form, Query, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+from bson.errors import InvalidId
+from gridfs.errors import NoFile
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, BinaryIO, Tuple
 import uuid
 from datetime import datetime
-import base64
 import asyncio
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import re
+import tempfile
+
+from emergentintegrations.llm.chat import LlmChat, UserMessage
 
 # Import the new Multi-AI service
-from ai_models.multi_ai_service import MultiAIService, GenerationResult
+from ai_models.multi_ai_service import (
+    MultiAIService, GenerationResult, ModelProvider, ModelType, TEMP_IMAGE_DIR,
+    generation_cache_key, new_image_hasher
+)
+from ai_models.rate_limiter import estimate_tokens, get_gemini_rate_limiter
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '50')),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '5')),
+    serverSelectionTimeoutMS=3000
+)
 db = client[os.environ['DB_NAME']]
+# Screenshots live in GridFS; session documents only keep a reference
+fs = AsyncIOMotorGridFSBucket(db)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await create_indexes()
+    yield
+    # Let off-path writes land before the client goes away
+    session_writes.flush()
+    if _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
+    client.close()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -33,6 +64,37 @@ api_router = APIRouter(prefix="/api")
 # Initialize Multi-AI Service
 multi_ai_service = MultiAIService()
 
+# How long generated code is reused for an identical upload. This MongoDB layer is shared
+# by all workers and survives restarts; the service keeps a short per-worker LRU in front
+# of it under the same generation_cache_key
+CODEGEN_CACHE_TTL = int(os.environ.get('CODEGEN_CACHE_TTL', str(7 * 24 * 3600)))
+
+# Uploads are copied to disk 64 KiB at a time
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Markdown fences and chatty preambles stripped from chat responses
+_MARKDOWN_RE = re.compile(
+    r"(?:```(?:\w+)?\s*\n?|```\s*$|^Here(?:'s| is).*?:\s*)",
+    re.MULTILINE | re.IGNORECASE
+)
+
+# Follow-up chat goes straight to a single Gemini model
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
+CHAT_MODEL = "gemini-1.5-flash"
+CHAT_SYSTEM_MESSAGE = "You are an expert frontend developer helping improve existing code."
+
+# Cap on concurrent direct Gemini calls, sized to the account's quota
+GEMINI_SEM = asyncio.Semaphore(int(os.environ.get('GEMINI_MAX_CONCURRENCY', '8')))
+
+# Longest a streamed chat reply may go without the upstream sending anything
+CHAT_STREAM_IDLE_TIMEOUT = 60.0
+
+# Appended to a plain-text chat stream that fails partway, since the 200 status is already sent
+STREAM_ERROR_MARKER = "\n\n[error: reply incomplete]\n"
+
+# Writes scheduled off the response path, referenced until they finish
+_background_tasks: "set[asyncio.Task]" = set()
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -42,7 +104,7 @@ logger = logging.getLogger(__name__)
 
 # Define Models
 class StatusCheck(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     client_name: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
@@ -67,17 +129,6 @@ class ChatRequest(BaseModel):
     message: str
     current_code: Optional[str] = None
 
-class ProjectSession(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    image_base64: str
-    technology: str
-    generated_code: Optional[str] = None
-    chat_messages: List[dict] = []
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
-    model_used: Optional[str] = None
-    all_models_tried: List[str] = []
-
 @api_router.get("/")
 async def get_root():
     return {"message": "Enhanced Multi-AI Vision to Code Generator API"}
@@ -86,29 +137,36 @@ async def get_root():
 async def get_available_models():
     """Get list of available AI models"""
     try:
-        models = multi_ai_service.get_available_models()
-        return {
-            "available_models": models,
-            "total_models": len(models),
-            "image_support_models": len([m for m in models if m["supports_images"]]),
-            "text_only_models": len([m for m in models if not m["supports_images"]])
-        }
+        return available_models_summary()
     except Exception as e:
-        logger.error(f"Error getting available models: {str(e)}")
+        logger.error("Error getting available models: %s", e)
         raise HTTPException(status_code=500, detail="Failed to get available models")
 
+@lru_cache(maxsize=1)
+def available_models_summary() -> Dict[str, Any]:
+    """Model list and counts; the configured models don't change after startup"""
+    models = multi_ai_service.get_available_models()
+    return {
+        "available_models": models,
+        "total_models": len(models),
+        "image_support_models": len([m for m in models if m["supports_images"]]),
+        "text_only_models": len([m for m in models if not m["supports_images"]])
+    }
+
 @api_router.post("/status-check")
 async def create_status_check(status: StatusCheckCreate):
     status_check = StatusCheck(client_name=status.client_name)
-    result = await db.status_checks.insert_one(status_check.dict())
+    result = await db.status_checks.insert_one(status_check.model_dump())
     return {"id": str(result.inserted_id), "message": f"Status check created for {status.client_name}"}
 
 @api_router.get("/status-checks")
-async def get_status_checks():
-    status_checks = []
-    async for status in db.status_checks.find():
+async def get_status_checks(
+    skip: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=1000)
+):
+    status_checks = await db.status_checks.find().skip(skip).limit(limit).to_list(length=limit)
+    for status in status_checks:
         status['_id'] = str(status['_id'])
-        status_checks.append(status)
     return status_checks
 
 @api_router.post("/upload-and-generate")
@@ -121,44 +179,70 @@ async def upload_and_generate(
     Enhanced upload and generate with Multi-AI support
     """
     try:
-        logger.info(f"Multi-AI request for technology: {technology}")
+        logger.info("Multi-AI request for technology: %s", technology)
         
         # Validate file type
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Read image data
-        contents = await file.read()
-        image_base64 = base64.b64encode(contents).decode('utf-8')
-        
         # Create session
-        session_id = str(uuid.uuid4())
+        session_id = uuid.uuid4().hex
+        
+        # Stream the upload to a temp file instead of holding the raw image in memory
+        with tempfile.NamedTemporaryFile(dir=TEMP_IMAGE_DIR, delete=False, suffix='.png') as image_file:
+            try:
+                image_digest = await stream_upload_to_file(file, image_file)
+                
+                # Store the image in GridFS from the same file
+                image_file.seek(0)
+                image_id = await fs.upload_from_stream(
+                    f"{session_id}.png",
+                    image_file,
+                    metadata={"content_type": file.content_type}
+                )
+            except Exception:
+                os.unlink(image_file.name)
+                raise
         
         # Generate code using Multi-AI service
         start_time = asyncio.get_event_loop().time()
         
         try:
-            best_result, all_results = await multi_ai_service.generate_code_multi_ai(
-                prompt=f"Generate {technology} code for this UI screenshot",
-                technology=technology,
-                image_data=contents,
-                user_comments=comments,
-                max_models=3  # Try up to 3 models
-            )
+            # Identical screenshot + prompt + technology + comments reuses the stored generation
+            prompt = f"Generate {technology} code for this UI screenshot"
+            cache_key = generation_cache_key(image_digest, prompt, technology, comments)
+            best_result = await get_cached_generation(cache_key)
+            cache_hit = best_result is not None
+            
+            if cache_hit:
+                all_results = [best_result]
+                logger.info("Code generation cache hit for model %s", best_result.model_type.value)
+            else:
+                best_result, all_results = await multi_ai_service.generate_code_multi_ai(
+                    prompt=prompt,
+                    technology=technology,
+                    image_path=image_file.name,
+                    image_digest=image_digest,
+                    user_comments=comments,
+                    max_models=3  # Try up to 3 models
+                )
             
             generation_time = asyncio.get_event_loop().time() - start_time
             
             if not best_result or not best_result.success:
                 raise ValueError("All AI models failed to generate code")
             
+            if not cache_hit:
+                run_in_background(store_cached_generation(cache_key, best_result), "codegen cache write")
+            
             # Prepare response data
             all_models_tried = [r.model_type.value for r in all_results]
             
-            logger.info(f"Multi-AI generation successful. Best model: {best_result.model_type.value}")
-            logger.info(f"Models tried: {all_models_tried}")
+            logger.info("Multi-AI generation successful. Best model: %s", best_result.model_type.value)
+            logger.info("Models tried: %s", all_models_tried)
             
         except Exception as e:
-            logger.error(f"Multi-AI generation failed: {str(e)}")
+            logger.error("Multi-AI generation failed: %s", e)
             # Fallback to error handling
             best_result = GenerationResult(
                 model_type=None,
@@ -168,47 +252,165 @@ async def upload_and_generate(
             )
             all_results = []
             generation_time = 0.1
+        finally:
+            try:
+                os.unlink(image_file.name)
+            except OSError:
+                pass
         
-        # Save to database
-        session_data = ProjectSession(
-            id=session_id,
-            image_base64=image_base64,
-            technology=technology,
-            generated_code=best_result.code,
-            model_used=best_result.model_type.value if best_result.model_type else "fallback",
-            all_models_tried=[r.model_type.value for r in all_results] if all_results else [],
-            chat_messages=[{
+        # Save to database as a plain document; no model validation pass on the hot path
+        model_used = best_result.model_type.value if best_result.model_type else "fallback"
+        models_tried = [r.model_type.value for r in all_results] if all_results else []
+        now = datetime.utcnow()
+        await db.project_sessions.insert_one({
+            "id": session_id,
+            "image_id": str(image_id),
+            "technology": technology,
+            "generated_code": best_result.code,
+            "chat_messages": [{
                 "type": "ai",
-                "message": f"Generated {technology} code using {best_result.model_type.value if best_result.model_type else 'fallback'} model" + 
+                "message": f"Generated {technology} code using {model_used} model" + 
                           (" with your specific requirements!" if comments.strip() else ""),
-                "timestamp": datetime.utcnow().isoformat()
-            }]
-        )
+                "timestamp": now
+            }],
+            "created_at": now,
+            "updated_at": now,
+            "model_used": model_used,
+            "all_models_tried": models_tried
+        })
         
-        await db.project_sessions.insert_one(session_data.dict())
-        
-        return {
+        # Plain JSON types only, so skip jsonable_encoder's walk over the generated code
+        return ORJSONResponse({
             "session_id": session_id,
             "code": best_result.code,
             "technology": technology,
-            "model_used": best_result.model_type.value if best_result.model_type else "fallback",
-            "all_models_tried": [r.model_type.value for r in all_results] if all_results else [],
+            "model_used": model_used,
+            "all_models_tried": models_tried,
             "generation_time": generation_time,
             "message": "Code generated successfully using Multi-AI system"
-        }
+        })
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error in upload_and_generate: {str(e)}")
+        logger.error("Unexpected error in upload_and_generate: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-def create_fallback_code(technology: str, error_message: str) -> str:
-    """Create fallback code when all AI models fail"""
-    if technology.lower() == "react":
-        return f"""import React from 'react';
-
-const ErrorComponent = () => {{
+async def get_cached_generation(cache_key: str) -> Optional[GenerationResult]:
+    """Look up a stored generation for an identical upload"""
+    cached = await db.codegen_cache.find_one({"_id": cache_key})
+    if not cached:
+        return None
+    return GenerationResult(
+        model_type=ModelType(cached["model_used"]),
+        provider=ModelProvider(cached["provider"]),
+        success=True,
+        code=cached["code"]
+    )
+
+async def store_cached_generation(cache_key: str, result: GenerationResult) -> None:
+    """Store a successful generation for reuse on identical uploads"""
+    await db.codegen_cache.update_one(
+        {"_id": cache_key},
+        {"$set": {
+            "code": result.code,
+            "model_used": result.model_type.value,
+            "provider": result.provider.value,
+            "created_at": datetime.utcnow()
+        }},
+        upsert=True
+    )
+
+def run_in_background(coro, description: str) -> None:
+    """Schedule a database write without awaiting it, logging any failure"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(lambda t: _finish_background_task(t, description))
+
+def _finish_background_task(task: asyncio.Task, description: str) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error("Background %s failed: %s", description, task.exception())
+
+class BulkWriteBatcher:
+    """
+    Coalesce single-document writes to a collection into bulk_write calls
+    
+    With ordered=True, writes are applied in the order they were queued, so later
+    updates to the same document win. A failed write only fails its own caller
+    (and, when ordered, the callers queued after it, which the server then skips).
+    """
+    
+    def __init__(self, collection, max_batch: int = 100, max_delay: float = 0.02, ordered: bool = False):
+        self.collection = collection
+        self.ordered = ordered
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+    
+    async def write(self, operation) -> None:
+        """Queue a write and wait until the batch containing it is acknowledged"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((operation, future))
+        if len(self._pending) >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self.flush)
+        await future
+    
+    def flush(self) -> None:
+        """Send everything queued so far as one bulk_write"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            run_in_background(self._send(batch), f"bulk write to {self.collection.name}")
+    
+    async def _send(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        errors: Dict[int, Exception] = {}
+        try:
+            await self.collection.bulk_write([operation for operation, _ in batch], ordered=self.ordered)
+        except BulkWriteError as e:
+            for write_error in e.details.get("writeErrors", []):
+                errors[write_error["index"]] = BulkWriteError({"writeErrors": [write_error]})
+            if self.ordered and errors:
+                # An ordered batch stops at its first error; nothing after it was applied
+                first = min(errors)
+                for index in range(first + 1, len(batch)):
+                    errors[index] = RuntimeError("Skipped after an earlier write in the batch failed")
+        except Exception as e:
+            errors = dict.fromkeys(range(len(batch)), e)
+        
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in errors:
+                future.set_exception(errors[index])
+            else:
+                future.set_result(None)
+
+# Bursty chat reply writes share round-trips; ordered so a session's replies land in sequence
+session_writes = BulkWriteBatcher(db.project_sessions, ordered=True)
+
+async def stream_upload_to_file(file: UploadFile, dest: BinaryIO) -> str:
+    """Copy an upload to dest chunk by chunk, returning the image digest"""
+    hasher = new_image_hasher()
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        if TEMP_IMAGE_DIR is None:
+            # Temp files are on disk, so keep the blocking write off the event loop
+            await asyncio.to_thread(dest.write, chunk)
+        else:
+            dest.write(chunk)
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+# Fallback component shown when every model fails; the error text is filled in with str.replace
+_REACT_FALLBACK_TEMPLATE = """import React from 'react';
+
+const ErrorComponent = () => {
   return (
     <div className="p-6 bg-yellow-50 border-2 border-yellow-200 rounded-lg max-w-md mx-auto">
       <h3 className="text-lg font-bold text-yellow-800 mb-2">Multi-AI Generation Notice</h3>
@@ -217,48 +419,55 @@ const ErrorComponent = () => {{
       </p>
       <details>
         <summary className="cursor-pointer text-sm text-yellow-600">Technical Details</summary>
-        <pre className="text-xs mt-2 p-2 bg-yellow-100 rounded">{error_message[:200]}...</pre>
+        <pre className="text-xs mt-2 p-2 bg-yellow-100 rounded">__ERROR_DETAILS__...</pre>
       </details>
       <div className="mt-4 p-3 bg-white rounded border">
         <p className="text-sm">Replace this content with your actual UI components.</p>
       </div>
     </div>
   );
-}};
+};
 
 export default ErrorComponent;"""
+
+def create_fallback_code(technology: str, error_message: str) -> str:
+    """Create fallback code when all AI models fail"""
+    if technology.lower() == "react":
+        return _REACT_FALLBACK_TEMPLATE.replace("__ERROR_DETAILS__", error_message[:200])
     
     return f"/* Multi-AI Generation Error: {error_message} */"
 
-@api_router.post("/chat")
-async def chat_endpoint(request: ChatRequest):
-    """
-    Enhanced chat endpoint that can use multi-AI for responses
-    """
-    try:
-        # Get session from database
-        session = await db.project_sessions.find_one({"id": request.session_id})
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        # For chat, we'll use a simpler single-model approach for now
-        # Could be enhanced to use multi-AI for complex requests
-        
-        from emergentintegrations.llm.chat import LlmChat, UserMessage
-        
-        # Create chat instance using Gemini (primary model)
-        gemini_key = os.environ.get('GEMINI_API_KEY')
-        if not gemini_key:
-            raise ValueError("GEMINI_API_KEY not configured")
-            
-        chat = LlmChat(
-            session_id=request.session_id,
-            system_message="You are an expert frontend developer helping improve existing code.",
-            api_key=gemini_key
-        ).with_model("gemini", "gemini-1.5-flash")
-        
-        # Create context message
-        context = f"""
+async def start_chat(request: ChatRequest) -> Tuple[LlmChat, UserMessage, str]:
+    """Record the user message and build the Gemini chat for a session"""
+    now = datetime.utcnow()
+    chat_message = {
+        "type": "user",
+        "message": request.message,
+        "timestamp": now
+    }
+    
+    # For chat, we'll use a simpler single-model approach for now
+    # Could be enhanced to use multi-AI for complex requests
+    
+    # Build the client first so a missing API key fails before anything is written
+    chat = build_chat(request.session_id)
+    
+    # Record the user message and read the session in one round-trip;
+    # chat history isn't needed for the prompt
+    session = await db.project_sessions.find_one_and_update(
+        {"id": request.session_id},
+        {
+            "$push": {"chat_messages": chat_message},
+            "$set": {"updated_at": now}
+        },
+        projection={"_id": 0, "technology": 1, "generated_code": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    # Create context message
+    context = f"""
 You are helping improve existing {session['technology']} code based on user feedback.
 
 Current code:
@@ -269,43 +478,63 @@ User request: {request.message}
 Please provide an improved version of the code that addresses the user's request.
 Return ONLY the updated code, no explanations.
 """
-        
-        user_message = UserMessage(text=context)
+    
+    return chat, UserMessage(text=context), session['technology']
+
+def build_chat(session_id: str) -> LlmChat:
+    """Create the Gemini chat used for follow-up edits on a session"""
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY not configured")
+    
+    return LlmChat(
+        session_id=session_id,
+        system_message=CHAT_SYSTEM_MESSAGE,
+        api_key=GEMINI_API_KEY
+    ).with_model("gemini", CHAT_MODEL)
+
+async def save_chat_reply(session_id: str, cleaned_response: str) -> None:
+    """Append the AI reply to the session and make it the current code"""
+    now = datetime.utcnow()
+    ai_message = {
+        "type": "ai", 
+        "message": cleaned_response,
+        "timestamp": now
+    }
+    
+    await session_writes.write(UpdateOne(
+        {"id": session_id},
+        {
+            "$push": {
+                "chat_messages": ai_message
+            },
+            "$set": {
+                "updated_at": now,
+                "generated_code": cleaned_response
+            }
+        }
+    ))
+
+@api_router.post("/chat")
+async def chat_endpoint(request: ChatRequest):
+    """
+    Enhanced chat endpoint that can use multi-AI for responses
+    """
+    try:
+        chat, user_message, technology = await start_chat(request)
         
         # Get AI response
-        response = await chat.send_message(user_message)
+        async with GEMINI_SEM:
+            await get_gemini_rate_limiter().acquire(estimate_tokens(user_message.text))
+            response = await chat.send_message(user_message)
         
         if not response:
             response = "I apologize, but I couldn't process your request. Please try rephrasing your message."
         
         # Clean the response
-        cleaned_response = clean_generated_code(response, session['technology'])
-        
-        # Update session with new chat message
-        chat_message = {
-            "type": "user",
-            "message": request.message,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        
-        ai_message = {
-            "type": "ai", 
-            "message": cleaned_response,
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        cleaned_response = await asyncio.to_thread(clean_generated_code, response, technology)
         
-        await db.project_sessions.update_one(
-            {"id": request.session_id},
-            {
-                "$push": {
-                    "chat_messages": {"$each": [chat_message, ai_message]}
-                },
-                "$set": {
-                    "updated_at": datetime.utcnow(),
-                    "generated_code": cleaned_response
-                }
-            }
-        )
+        # The client only needs the reply, so persist it off the response path
+        run_in_background(save_chat_reply(request.session_id, cleaned_response), "chat reply write")
         
         return {
             "response": cleaned_response,
@@ -315,76 +544,175 @@ Return ONLY the updated code, no explanations.
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in chat endpoint: {str(e)}")
+        logger.error("Error in chat endpoint: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
+def sse_event(data: str, event: Optional[str] = None) -> str:
+    """Frame text as one server-sent event, one data line per line of text"""
+    header = f"event: {event}\n" if event else ""
+    return header + "".join(f"data: {line}\n" for line in data.split("\n")) + "\n"
+
+async def next_stream_chunk(stream) -> Optional[str]:
+    """Next chunk of an upstream reply, or None at the end; times out if the upstream stalls"""
+    try:
+        return await asyncio.wait_for(stream.__anext__(), timeout=CHAT_STREAM_IDLE_TIMEOUT)
+    except StopAsyncIteration:
+        return None
+
+@api_router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
+    """
+    Chat endpoint that streams the raw reply while it is generated
+    
+    Sends server-sent events when the client accepts text/event-stream, plain
+    text otherwise. A failure partway ends SSE with an error event and plain text
+    with STREAM_ERROR_MARKER. The cleaned reply is saved to the session once the
+    stream completes.
+    """
+    try:
+        chat, user_message, technology = await start_chat(request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error in chat stream endpoint: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+    
+    use_sse = "text/event-stream" in http_request.headers.get("accept", "")
+    
+    async def stream_reply():
+        chunks = []
+        stream = None
+        try:
+            # Hold a Gemini slot only until the upstream reply starts, not while the client reads
+            async with GEMINI_SEM:
+                await get_gemini_rate_limiter().acquire(estimate_tokens(user_message.text))
+                stream_message = getattr(chat, "stream_message", None)
+                if stream_message is None:
+                    # Client without streaming support: the whole reply arrives as one chunk
+                    chunk = await asyncio.wait_for(chat.send_message(user_message), timeout=CHAT_STREAM_IDLE_TIMEOUT) or None
+                else:
+                    stream = stream_message(user_message).__aiter__()
+                    chunk = await next_stream_chunk(stream)
+            
+            while chunk is not None:
+                chunks.append(chunk)
+                yield sse_event(chunk) if use_sse else chunk
+                chunk = await next_stream_chunk(stream) if stream is not None else None
+        except Exception as e:
+            # Headers are already sent, so the stream can only end with an error marker
+            logger.error("Error streaming chat reply: %s", e)
+            yield sse_event("Internal server error", event="error") if use_sse else STREAM_ERROR_MARKER
+            return
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose:
+                try:
+                    await aclose()
+                except Exception:
+                    pass
+        
+        if chunks:
+            cleaned_response = await asyncio.to_thread(clean_generated_code, "".join(chunks), technology)
+            run_in_background(save_chat_reply(request.session_id, cleaned_response), "chat reply write")
+        if use_sse:
+            yield sse_event("", event="done")
+    
+    media_type = "text/event-stream" if use_sse else "text/plain; charset=utf-8"
+    return StreamingResponse(stream_reply(), media_type=media_type)
+
 def clean_generated_code(code: str, technology: str) -> str:
     """Clean and validate generated code"""
     if not code:
         return create_fallback_code(technology, "Empty response")
     
-    # Remove markdown code blocks
-    cleaned = code.strip()
-    
-    # Remove common markdown patterns
-    import re
-    markdown_patterns = [
-        r'```(\w+)?\s*\n?',
-        r'```\s*$',
-        r'^Here\'s.*?:\s*',
-        r'^Here is.*?:\s*'
-    ]
-    
-    for pattern in markdown_patterns:
-        cleaned = re.sub(pattern, '', cleaned, flags=re.MULTILINE | re.IGNORECASE)
-    
-    return cleaned.strip()
+    # Remove markdown code blocks and common preambles in a single pass
+    return _MARKDOWN_RE.sub('', code.strip()).strip()
 
 @api_router.get("/sessions/{session_id}")
 async def get_session(session_id: str):
     """Get a specific session"""
-    session = await db.project_sessions.find_one({"id": session_id})
+    session = await db.project_sessions.find_one({"id": session_id}, {"_id": 0})
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Remove MongoDB _id field
-    if '_id' in session:
-        del session['_id']
+    # Mongo documents are plain JSON types plus datetimes, which orjson handles directly
+    return ORJSONResponse(session)
+
+@api_router.get("/sessions/{session_id}/image")
+async def get_session_image(session_id: str):
+    """Stream the screenshot for a session"""
+    session = await db.project_sessions.find_one({"id": session_id}, {"image_id": 1})
+    if not session or not session.get("image_id"):
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    try:
+        grid_out = await fs.open_download_stream(ObjectId(session["image_id"]))
+    except (InvalidId, NoFile):
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    async def iter_image():
+        while chunk := await grid_out.readchunk():
+            yield chunk
     
-    return session
+    media_type = (grid_out.metadata or {}).get("content_type", "image/png")
+    return StreamingResponse(iter_image(), media_type=media_type)
 
 @api_router.get("/sessions")
-async def get_all_sessions():
-    """Get all sessions"""
-    sessions = []
-    async for session in db.project_sessions.find().sort("created_at", -1):
-        # Remove MongoDB _id field
-        if '_id' in session:
-            del session['_id']
-        sessions.append(session)
-    
-    return sessions
+async def get_all_sessions(
+    skip: int = Query(default=0, ge=0),
+    limit: int = Query(default=20, ge=1, le=100)
+):
+    """Get a page of sessions, newest first, with listing fields only"""
+    cursor = db.project_sessions.find({}, SESSION_LIST_PROJECTION).sort("created_at", -1).skip(skip).limit(limit)
+    return ORJSONResponse(await cursor.to_list(length=limit))
+
+# Fields returned by the session listing; _id is dropped server-side
+SESSION_LIST_PROJECTION = {"_id": 0, "id": 1, "technology": 1, "created_at": 1, "updated_at": 1}
 
 # Include the API router
 app.include_router(api_router)
 
+# Explicit origins: credentialed requests can't use a wildcard, and a fixed list skips per-request reflection
+CORS_ORIGINS = [
+    origin.strip()
+    for origin in os.environ.get(
+        'CORS_ORIGINS',
+        "https://abc12f14-f90d-4b88-9143-9c9857f3647b.preview.emergentagent.com,"
+        "http://localhost:3000,"
+        "http://127.0.0.1:3000"
+    ).split(',')
+    if origin.strip()
+]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "https://abc12f14-f90d-4b88-9143-9c9857f3647b.preview.emergentagent.com",
-        "http://localhost:3000",
-        "http://127.0.0.1:3000",
-        "*"
-    ],
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
 )
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+async def create_indexes():
+    """Create the indexes the API's queries rely on"""
+    # Sessions and status checks are looked up by their own "id", not _id
+    await db.project_sessions.create_index("id", unique=True)
+    await db.status_checks.create_index("id", unique=True)
+    await db.project_sessions.create_index([("created_at", -1)])
+    await db.codegen_cache.create_index("created_at", expireAfterSeconds=CODEGEN_CACHE_TTL)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    # "auto" runs one worker per core; each worker has its own rate limits and caches
+    workers_setting = os.environ.get('UVICORN_WORKERS', '1')
+    worker_count = (os.cpu_count() or 1) if workers_setting == 'auto' else int(workers_setting)
+    
+    # The event loop defaults to uvloop when installed. Extra workers need an import string;
+    # a single worker serves this module's app so server.py isn't imported (and its Mongo pool opened) twice
+    uvicorn.run(
+        app if worker_count == 1 else "server:app",
+        app_dir=str(ROOT_DIR),
+        host="0.0.0.0",
+        port=8001,
+        http="httptools",
+        workers=worker_count
+    )
\ No newline at end of file
@@ -4,18 +4,132 @@ Backend API Testing for Screenshot-to-Code Generator
 Tests all backend endpoints with real data and scenarios
 """
 
-import requests
 import json
 import base64
 import io
-from PIL import Image
+from PIL import Image, ImageDraw
 import time
 import os
+import sys
+import logging
+import logging.handlers
+import queue
+import re
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from collections import defaultdict, deque
+import threading
+import atexit
+import hashlib
+import shelve
+from tests._http import SESSION, BACKEND_URL, timeout
 
 # Configuration
-BACKEND_URL = "https://abc12f14-f90d-4b88-9143-9c9857f3647b.preview.emergentagent.com/api"
-TEST_RESULTS = []
+TEST_RESULTS = deque()
+
+# (second, formatted text) of the last log_test timestamp
+_last_timestamp = (0, "")
+
+# Large code-generation payloads decode noticeably faster with orjson when it is installed
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# TEST_USE_CACHE=1 replays successful upload responses and the fixed 404 probe from disk
+# across local runs; leave it unset in CI so the real backend is always exercised
+_RESPONSE_CACHE = None
+_CACHE_LOCK = threading.Lock()
+if os.environ.get('TEST_USE_CACHE') == '1':
+    _RESPONSE_CACHE = shelve.open(str(Path(__file__).with_name('.test_cache.db')))
+    atexit.register(_RESPONSE_CACHE.close)
+
+# A failure in any test whose name contains one of these fails the whole run
+CRITICAL_TESTS = ("Health Check", "Code Generation", "Gemini AI", "Comments")
+
+# TEST_VERBOSE=0 prints only the final summary, e.g. when running in CI;
+# TEST_DEBUG=1 also prints request/response details
+_VERBOSE = os.environ.get('TEST_VERBOSE', '1') == '1'
+_DEBUG = os.environ.get('TEST_DEBUG') == '1'
+
+# Per-test progress lines are queued and written by one listener thread, so workers
+# never block on stdout and their lines never interleave
+logger = logging.getLogger("backend_test")
+logger.setLevel(logging.DEBUG if _DEBUG else logging.INFO if _VERBOSE else logging.WARNING)
+logger.propagate = False
+_LOG_QUEUE = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_LOG_QUEUE))
+_LOG_LISTENER = logging.handlers.QueueListener(_LOG_QUEUE, logging.StreamHandler(sys.stdout))
+
+# Fields every upload-and-generate / session response must carry
+_REQUIRED_UPLOAD_FIELDS = frozenset({'session_id', 'code', 'technology', 'image_base64', 'comments'})
+_REQUIRED_SESSION_FIELDS = frozenset({'id', 'image_id', 'technology', 'generated_code'})
+
+# Words from the test comments that should show up in generated code, found in one
+# case-insensitive scan without lowercasing a copy of the code
+_COMMENT_INDICATORS_RE = re.compile(r"blue|sticky|hover|navbar", re.IGNORECASE)
+_INTEGRATION_TERMS_RE = re.compile(r"purple|testing", re.IGNORECASE)
+_BLANK_RE = re.compile(r"blank", re.IGNORECASE)
+
+# Result counts per (test category, status); a category is the test name without its "(variant)" suffix
+_STATUS_COUNTS = defaultdict(int)
+_RESULTS_LOCK = threading.Lock()
+
+def _timestamp():
+    """Current local time as text, formatted at most once per second"""
+    global _last_timestamp
+    now = int(time.time())
+    second, text = _last_timestamp
+    if second != now:
+        text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        # Rebinding a tuple keeps concurrent readers from seeing a half-updated pair
+        _last_timestamp = (now, text)
+    return text
+
+class _CachedResponse:
+    """Status and body of an earlier upload response, replayed from the local cache"""
+    
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode()
+
+def post_upload(files, data):
+    """POST to /upload-and-generate, replaying cached successes when TEST_USE_CACHE=1"""
+    if _RESPONSE_CACHE is None:
+        return SESSION.post(f"{BACKEND_URL}/upload-and-generate", files=files, data=data, timeout=timeout(30))
+    
+    _, content, _ = files['file']
+    key = hashlib.sha256(content + repr(sorted(data.items())).encode()).hexdigest()
+    with _CACHE_LOCK:
+        cached = _RESPONSE_CACHE.get(key)
+    if cached:
+        return _CachedResponse(**cached)
+    
+    response = SESSION.post(f"{BACKEND_URL}/upload-and-generate", files=files, data=data, timeout=timeout(30))
+    if response.status_code == 200:
+        with _CACHE_LOCK:
+            _RESPONSE_CACHE[key] = {"status_code": response.status_code, "text": response.text}
+    return response
+
+def get_cached(url, cacheable_status, max_age=3600):
+    """GET a deterministic URL, replaying a cached response with cacheable_status for up to max_age seconds"""
+    if _RESPONSE_CACHE is None:
+        return SESSION.get(url, timeout=timeout(10))
+    
+    key = f"GET {url}"
+    with _CACHE_LOCK:
+        cached = _RESPONSE_CACHE.get(key)
+    if cached and time.time() - cached["stored_at"] < max_age:
+        return _CachedResponse(cached["status_code"], cached["text"])
+    
+    response = SESSION.get(url, timeout=timeout(10))
+    if response.status_code == cacheable_status:
+        with _CACHE_LOCK:
+            _RESPONSE_CACHE[key] = {"status_code": response.status_code, "text": response.text, "stored_at": time.time()}
+    return response
 
 def log_test(test_name, status, details=""):
     """Log test results"""
@@ -23,18 +137,21 @@ def log_test(test_name, status, details=""):
         "test": test_name,
         "status": status,
         "details": details,
-        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+        "timestamp": _timestamp()
     }
-    TEST_RESULTS.append(result)
-    print(f"[{status}] {test_name}: {details}")
+    category = test_name.split(" (", 1)[0]
+    with _RESULTS_LOCK:
+        TEST_RESULTS.append(result)
+        _STATUS_COUNTS[(category, status)] += 1
+    logger.info("[%s] %s: %s", status, test_name, details)
 
+@lru_cache(maxsize=1)
 def create_test_image():
-    """Create a simple test image for upload testing"""
+    """Create a simple test image for upload testing (rendered once per run)"""
     # Create a more realistic UI mockup image
     img = Image.new('RGB', (600, 400), color='#f8f9fa')
     
     # Add some basic UI elements (simulate a login form)
-    from PIL import ImageDraw, ImageFont
     draw = ImageDraw.Draw(img)
     
     # Draw a login form layout
@@ -52,19 +169,15 @@ def create_test_image():
     draw.rectangle([200, 270, 400, 300], fill='#28a745', outline='#28a745')
     
     # Add text labels
-    try:
-        # Try to use a font, but don't fail if not available
-        draw.text((200, 45), "Login Form", fill='white')
-        draw.text((140, 145), "Username:", fill='black')
-        draw.text((140, 195), "Password:", fill='black')
-        draw.text((280, 280), "Sign In", fill='white')
-        draw.text((250, 320), "Forgot Password?", fill='#007bff')
-    except:
-        pass  # Font might not be available, but shape is enough
+    draw.text((200, 45), "Login Form", fill='white')
+    draw.text((140, 145), "Username:", fill='black')
+    draw.text((140, 195), "Password:", fill='black')
+    draw.text((280, 280), "Sign In", fill='white')
+    draw.text((250, 320), "Forgot Password?", fill='#007bff')
     
-    # Convert to bytes
+    # Convert to bytes; light compression is plenty for a flat-colour mockup
     img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format='PNG')
+    img.save(img_byte_arr, format='PNG', optimize=False, compress_level=1)
     img_byte_arr.seek(0)
     
     return img_byte_arr.getvalue()
@@ -72,9 +185,9 @@ def create_test_image():
 def test_health_check():
     """Test the basic health check endpoint"""
     try:
-        response = requests.get(f"{BACKEND_URL}/", timeout=10)
+        response = SESSION.get(f"{BACKEND_URL}/", timeout=timeout(10))
         if response.status_code == 200:
-            data = response.json()
+            data = _loads(response.content)
             if "message" in data:
                 log_test("Health Check", "PASS", f"API is responding: {data['message']}")
                 return True
@@ -88,8 +201,20 @@ def test_health_check():
         log_test("Health Check", "FAIL", f"Connection error: {str(e)}")
         return False
 
+def _run_one_tech(tech, test_image):
+    """Upload the test image for one technology"""
+    files = {
+        'file': ('test_ui.png', test_image, 'image/png')
+    }
+    data = {
+        'technology': tech
+    }
+    
+    return post_upload(files, data)
+
 def test_file_upload_and_generation():
-    """Test the main file upload and code generation endpoint"""
+    """Test the main file upload and code generation endpoint, returning the React session ID"""
+    session_id = None
     try:
         # Create test image
         test_image = create_test_image()
@@ -97,55 +222,46 @@ def test_file_upload_and_generation():
         # Test different technologies
         technologies = ["react", "vue", "angular", "svelte", "html"]
         
-        for tech in technologies:
-            try:
-                files = {
-                    'file': ('test_ui.png', test_image, 'image/png')
-                }
-                data = {
-                    'technology': tech
-                }
-                
-                response = requests.post(
-                    f"{BACKEND_URL}/upload-and-generate",
-                    files=files,
-                    data=data,
-                    timeout=30
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    required_fields = ['session_id', 'code', 'technology', 'image_base64', 'comments']
+        # The uploads are independent, so send them together and check each as it returns
+        with ThreadPoolExecutor(max_workers=len(technologies)) as executor:
+            futures = {executor.submit(_run_one_tech, tech, test_image): tech for tech in technologies}
+            
+            for future in as_completed(futures):
+                tech = futures[future]
+                try:
+                    response = future.result()
                     
-                    if all(field in result for field in required_fields):
-                        # Check if we got a meaningful response (not just error message)
-                        if len(result['code']) > 50 and not "blank" in result['code'].lower():
-                            log_test(f"Code Generation ({tech})", "PASS", 
-                                   f"Generated {len(result['code'])} chars of code")
-                            
-                            # Store session_id for later tests
-                            if tech == "react":  # Use React session for subsequent tests
-                                global test_session_id
-                                test_session_id = result['session_id']
+                    if response.status_code == 200:
+                        result = _loads(response.content)
+                        missing = _REQUIRED_UPLOAD_FIELDS - result.keys()
+                        
+                        if not missing:
+                            # Check if we got a meaningful response (not just error message)
+                            if len(result['code']) > 50 and not _BLANK_RE.search(result['code']):
+                                log_test(f"Code Generation ({tech})", "PASS", 
+                                       f"Generated {len(result['code'])} chars of code")
+                                
+                                # Use the React session for the chat and session retrieval tests
+                                if tech == "react":
+                                    session_id = result['session_id']
+                            else:
+                                log_test(f"Code Generation ({tech})", "PARTIAL", 
+                                       f"AI detected blank/simple image - {len(result['code'])} chars")
                         else:
-                            log_test(f"Code Generation ({tech})", "PARTIAL", 
-                                   f"AI detected blank/simple image - {len(result['code'])} chars")
+                            log_test(f"Code Generation ({tech})", "FAIL", 
+                                   f"Missing fields: {sorted(missing)}")
                     else:
-                        missing = [f for f in required_fields if f not in result]
                         log_test(f"Code Generation ({tech})", "FAIL", 
-                               f"Missing fields: {missing}")
-                else:
-                    log_test(f"Code Generation ({tech})", "FAIL", 
-                           f"HTTP {response.status_code}: {response.text}")
-                    
-            except Exception as e:
-                log_test(f"Code Generation ({tech})", "FAIL", f"Error: {str(e)}")
+                               f"HTTP {response.status_code}: {response.text}")
+                        
+                except Exception as e:
+                    log_test(f"Code Generation ({tech})", "FAIL", f"Error: {str(e)}")
                 
-        return True
+        return session_id
         
     except Exception as e:
         log_test("File Upload Setup", "FAIL", f"Setup error: {str(e)}")
-        return False
+        return None
 
 def test_file_upload_with_comments():
     """Test file upload with comments parameter - NEW ENHANCED FEATURE"""
@@ -164,22 +280,17 @@ def test_file_upload_with_comments():
             'comments': test_comments
         }
         
-        print(f"DEBUG: Sending comments: '{test_comments}'")
+        logger.debug("Sending comments: '%s'", test_comments)
         
-        response = requests.post(
-            f"{BACKEND_URL}/upload-and-generate",
-            files=files,
-            data=data,
-            timeout=30
-        )
+        response = post_upload(files, data)
         
         if response.status_code == 200:
-            result = response.json()
-            print(f"DEBUG: Received comments: '{result.get('comments', 'MISSING')}'")
+            result = _loads(response.content)
+            logger.debug("Received comments: '%s'", result.get('comments', 'MISSING'))
             
-            required_fields = ['session_id', 'code', 'technology', 'image_base64', 'comments']
+            missing = _REQUIRED_UPLOAD_FIELDS - result.keys()
             
-            if all(field in result for field in required_fields):
+            if not missing:
                 # Check if comments are returned (even if empty, that's still valid)
                 received_comments = result.get('comments', '')
                 
@@ -190,17 +301,11 @@ def test_file_upload_with_comments():
                     return True  # Still consider it working since the endpoint accepts the parameter
                 elif received_comments == test_comments:
                     # Check if AI incorporated the comments (look for blue, sticky, hover in code)
-                    code_lower = result['code'].lower()
-                    comment_indicators = ['blue', 'sticky', 'hover', 'navbar']
-                    found_indicators = [word for word in comment_indicators if word in code_lower]
+                    found_indicators = sorted({word.lower() for word in _COMMENT_INDICATORS_RE.findall(result['code'])})
                     
                     if len(found_indicators) >= 2:  # At least 2 comment requirements should be in code
                         log_test("File Upload with Comments", "PASS", 
                                f"AI incorporated user requirements: {found_indicators}. Generated {len(result['code'])} chars")
-                        
-                        # Store session for later tests
-                        global test_session_with_comments
-                        test_session_with_comments = result['session_id']
                         return True
                     else:
                         log_test("File Upload with Comments", "PARTIAL", 
@@ -211,8 +316,7 @@ def test_file_upload_with_comments():
                            f"Comments field working. Generated {len(result['code'])} chars")
                     return True
             else:
-                missing = [f for f in required_fields if f not in result]
-                log_test("File Upload with Comments", "FAIL", f"Missing fields: {missing}")
+                log_test("File Upload with Comments", "FAIL", f"Missing fields: {sorted(missing)}")
                 return False
         else:
             log_test("File Upload with Comments", "FAIL", 
@@ -237,18 +341,13 @@ def test_file_upload_without_comments():
             # No comments parameter
         }
         
-        response = requests.post(
-            f"{BACKEND_URL}/upload-and-generate",
-            files=files,
-            data=data,
-            timeout=30
-        )
+        response = post_upload(files, data)
         
         if response.status_code == 200:
-            result = response.json()
-            required_fields = ['session_id', 'code', 'technology', 'image_base64', 'comments']
+            result = _loads(response.content)
+            missing = _REQUIRED_UPLOAD_FIELDS - result.keys()
             
-            if all(field in result for field in required_fields):
+            if not missing:
                 # Comments should be empty string when not provided
                 if result['comments'] == "":
                     log_test("File Upload without Comments", "PASS", 
@@ -259,8 +358,7 @@ def test_file_upload_without_comments():
                            f"Comments field present but not empty: '{result['comments']}'")
                     return True
             else:
-                missing = [f for f in required_fields if f not in result]
-                log_test("File Upload without Comments", "FAIL", f"Missing fields: {missing}")
+                log_test("File Upload without Comments", "FAIL", f"Missing fields: {sorted(missing)}")
                 return False
         else:
             log_test("File Upload without Comments", "FAIL", 
@@ -285,15 +383,10 @@ def test_file_upload_empty_comments():
             'comments': ''  # Empty comments
         }
         
-        response = requests.post(
-            f"{BACKEND_URL}/upload-and-generate",
-            files=files,
-            data=data,
-            timeout=30
-        )
+        response = post_upload(files, data)
         
         if response.status_code == 200:
-            result = response.json()
+            result = _loads(response.content)
             if 'comments' in result and result['comments'] == '':
                 log_test("File Upload with Empty Comments", "PASS", 
                        f"Empty comments handled correctly. Generated {len(result['code'])} chars")
@@ -328,22 +421,16 @@ def test_comments_integration_in_ai_prompt():
             'comments': test_comments
         }
         
-        response = requests.post(
-            f"{BACKEND_URL}/upload-and-generate",
-            files=files,
-            data=data,
-            timeout=30
-        )
+        response = post_upload(files, data)
         
         if response.status_code == 200:
-            result = response.json()
+            result = _loads(response.content)
             
             if 'code' in result:
-                code_lower = result['code'].lower()
-                
                 # Check if the AI incorporated the specific requirements
-                has_purple = 'purple' in code_lower
-                has_testing = 'testing' in code_lower
+                found_terms = {term.lower() for term in _INTEGRATION_TERMS_RE.findall(result['code'])}
+                has_purple = 'purple' in found_terms
+                has_testing = 'testing' in found_terms
                 
                 if has_purple and has_testing:
                     log_test("Comments Integration in AI Prompt", "PASS", 
@@ -380,11 +467,11 @@ def test_invalid_file_upload():
             'technology': 'react'
         }
         
-        response = requests.post(
+        response = SESSION.post(
             f"{BACKEND_URL}/upload-and-generate",
             files=files,
             data=data,
-            timeout=10
+            timeout=timeout(10)
         )
         
         if response.status_code == 400:
@@ -399,28 +486,28 @@ def test_invalid_file_upload():
         log_test("Invalid File Upload", "FAIL", f"Error: {str(e)}")
         return False
 
-def test_chat_functionality():
+def test_chat_functionality(session_id):
     """Test the chat endpoint"""
     try:
-        if 'test_session_id' not in globals():
+        if not session_id:
             log_test("Chat Functionality", "SKIP", "No session ID available from previous tests")
             return False
             
         chat_request = {
-            "session_id": test_session_id,
+            "session_id": session_id,
             "message": "Can you make the button larger and change the color to green?",
             "current_code": "// Previous code here"
         }
         
-        response = requests.post(
+        response = SESSION.post(
             f"{BACKEND_URL}/chat",
             json=chat_request,
             headers={'Content-Type': 'application/json'},
-            timeout=30
+            timeout=timeout(30)
         )
         
         if response.status_code == 200:
-            result = response.json()
+            result = _loads(response.content)
             if 'response' in result and 'session_id' in result:
                 if len(result['response']) > 10:
                     log_test("Chat Functionality", "PASS", 
@@ -441,37 +528,55 @@ def test_chat_functionality():
         log_test("Chat Functionality", "FAIL", f"Error: {str(e)}")
         return False
 
-def test_session_retrieval():
+def test_session_retrieval(session_id):
     """Test session retrieval endpoints"""
     try:
-        if 'test_session_id' not in globals():
+        if not session_id:
             log_test("Session Retrieval", "SKIP", "No session ID available")
             return False
             
+        # The reads are independent, so issue them together
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            session_future = executor.submit(SESSION.get, f"{BACKEND_URL}/sessions/{session_id}", timeout=timeout(10))
+            image_future = executor.submit(SESSION.get, f"{BACKEND_URL}/sessions/{session_id}/image", timeout=timeout(10))
+            sessions_future = executor.submit(SESSION.get, f"{BACKEND_URL}/sessions", timeout=timeout(10))
+        
         # Test individual session retrieval
-        response = requests.get(f"{BACKEND_URL}/session/{test_session_id}", timeout=10)
+        response = session_future.result()
         
         if response.status_code == 200:
-            session = response.json()
-            required_fields = ['id', 'image_base64', 'technology', 'generated_code']
+            session = _loads(response.content)
+            missing = _REQUIRED_SESSION_FIELDS - session.keys()
             
-            if all(field in session for field in required_fields):
+            if not missing:
                 log_test("Individual Session Retrieval", "PASS", 
                        f"Retrieved session with {len(session['generated_code'])} chars of code")
             else:
-                missing = [f for f in required_fields if f not in session]
-                log_test("Individual Session Retrieval", "FAIL", f"Missing fields: {missing}")
+                log_test("Individual Session Retrieval", "FAIL", f"Missing fields: {sorted(missing)}")
                 return False
         else:
             log_test("Individual Session Retrieval", "FAIL", 
                    f"HTTP {response.status_code}: {response.text}")
             return False
+        
+        # The screenshot is stored separately from the session and served on its own
+        response = image_future.result()
+        
+        if response.status_code == 200 and response.content == create_test_image():
+            log_test("Session Image Retrieval", "PASS", f"Retrieved {len(response.content)} byte screenshot")
+        elif response.status_code == 200:
+            log_test("Session Image Retrieval", "FAIL", "Returned image does not match the uploaded screenshot")
+            return False
+        else:
+            log_test("Session Image Retrieval", "FAIL", 
+                   f"HTTP {response.status_code}: {response.text}")
+            return False
             
         # Test all sessions retrieval
-        response = requests.get(f"{BACKEND_URL}/sessions", timeout=10)
+        response = sessions_future.result()
         
         if response.status_code == 200:
-            sessions = response.json()
+            sessions = _loads(response.content)
             if isinstance(sessions, list) and len(sessions) > 0:
                 log_test("All Sessions Retrieval", "PASS", f"Retrieved {len(sessions)} sessions")
                 return True
@@ -491,11 +596,17 @@ def test_invalid_session():
     """Test retrieval of non-existent session"""
     try:
         fake_session_id = "00000000-0000-0000-0000-000000000000"
-        response = requests.get(f"{BACKEND_URL}/session/{fake_session_id}", timeout=10)
+        response = get_cached(f"{BACKEND_URL}/sessions/{fake_session_id}", 404)
         
+        # Check the body too, so a 404 for a missing route can't pass
         if response.status_code == 404:
-            log_test("Invalid Session Handling", "PASS", "Correctly returned 404 for invalid session")
-            return True
+            detail = _loads(response.content).get("detail")
+            if detail == "Session not found":
+                log_test("Invalid Session Handling", "PASS", "Correctly returned 404 for invalid session")
+                return True
+            log_test("Invalid Session Handling", "FAIL", 
+                   f"404 did not come from the session lookup, detail: {detail!r}")
+            return False
         else:
             log_test("Invalid Session Handling", "FAIL", 
                    f"Should return 404 for invalid session, got HTTP {response.status_code}")
@@ -506,18 +617,18 @@ def test_invalid_session():
         return False
 
 def test_gemini_integration():
-    """Test if Gemini AI integration is working properly"""
+    """Test if Gemini AI integration is working properly (no requests; reads earlier results)"""
     try:
         # This is tested indirectly through code generation
-        # Check if we got meaningful responses in previous tests
-        code_gen_tests = [r for r in TEST_RESULTS if "Code Generation" in r["test"] and r["status"] == "PASS"]
-        chat_tests = [r for r in TEST_RESULTS if "Chat Functionality" in r["test"] and r["status"] == "PASS"]
+        # Check if we got meaningful responses in previous tests, counted as they were logged
+        code_gen_passes = _STATUS_COUNTS[("Code Generation", "PASS")]
+        chat_passes = _STATUS_COUNTS[("Chat Functionality", "PASS")]
         
-        if len(code_gen_tests) > 0 and len(chat_tests) > 0:
+        if code_gen_passes > 0 and chat_passes > 0:
             log_test("Gemini AI Integration", "PASS", 
-                   f"AI working in {len(code_gen_tests)} code generation tests and chat")
+                   f"AI working in {code_gen_passes} code generation tests and chat")
             return True
-        elif len(code_gen_tests) > 0:
+        elif code_gen_passes > 0:
             log_test("Gemini AI Integration", "PARTIAL", 
                    "Code generation working but chat may have issues")
             return True
@@ -530,6 +641,23 @@ def test_gemini_integration():
         log_test("Gemini AI Integration", "FAIL", f"Error: {str(e)}")
         return False
 
+def _run_test(test_name, test_func, *args):
+    """Run one test, logging an ERROR result if it raises"""
+    try:
+        return test_func(*args)
+    except Exception as e:
+        log_test(test_name, "ERROR", f"Test execution failed: {str(e)}")
+        return False
+
+def _run_phase(phase):
+    """Run a phase of (name, test, *args) entries concurrently, returning results in order"""
+    for test_name, *_ in phase:
+        logger.info("\nRunning: %s", test_name)
+    logger.info("-" * 40)
+    
+    with ThreadPoolExecutor(max_workers=len(phase)) as executor:
+        return list(executor.map(lambda test: _run_test(*test), phase))
+
 def run_all_tests():
     """Run all backend tests"""
     print("=" * 60)
@@ -538,55 +666,58 @@ def run_all_tests():
     print(f"Testing backend at: {BACKEND_URL}")
     print()
     
-    # Initialize global session variables
-    global test_session_id, test_session_with_comments
-    test_session_id = None
-    test_session_with_comments = None
+    _LOG_LISTENER.start()
     
-    # Run tests in order
-    tests = [
-        ("Basic Connectivity", test_health_check),
+    # Tests within a phase are independent and run concurrently; chat and session
+    # retrieval take the session ID returned by the generation test in phase 1
+    outcomes = _run_phase([
         ("File Upload & Code Generation", test_file_upload_and_generation),
+        ("Basic Connectivity", test_health_check),
+        ("Invalid File Handling", test_invalid_file_upload),
+        ("Invalid Session Handling", test_invalid_session),
+    ])
+    session_id = outcomes[0]
+    outcomes += _run_phase([
         ("File Upload WITH Comments (NEW)", test_file_upload_with_comments),
         ("File Upload WITHOUT Comments", test_file_upload_without_comments),
         ("File Upload with Empty Comments", test_file_upload_empty_comments),
         ("Comments Integration in AI Prompt", test_comments_integration_in_ai_prompt),
-        ("Invalid File Handling", test_invalid_file_upload),
-        ("Chat Functionality", test_chat_functionality),
-        ("Session Management", test_session_retrieval),
-        ("Invalid Session Handling", test_invalid_session),
-        ("Gemini AI Integration", test_gemini_integration),
-    ]
+        ("Chat Functionality", test_chat_functionality, session_id),
+        ("Session Management", test_session_retrieval, session_id),
+    ])
+    
+    # The Gemini summary only reads the results above, so run it inline
+    logger.info("\nRunning: Gemini AI Integration")
+    logger.info("-" * 40)
+    outcomes.append(_run_test("Gemini AI Integration", test_gemini_integration))
+    
+    # Write out any queued progress lines before the summary
+    _LOG_LISTENER.stop()
     
     passed = 0
     failed = 0
     skipped = 0
     
-    for test_name, test_func in tests:
-        print(f"\nRunning: {test_name}")
-        print("-" * 40)
-        
-        try:
-            result = test_func()
-            if result:
-                passed += 1
-            else:
-                failed += 1
-        except Exception as e:
-            log_test(test_name, "ERROR", f"Test execution failed: {str(e)}")
+    for result in outcomes:
+        if result:
+            passed += 1
+        else:
             failed += 1
     
-    # Count skipped tests
-    skipped = len([r for r in TEST_RESULTS if r["status"] == "SKIP"])
-    
-    # Print summary
+    # Print summary, counting skips and critical failures in the same pass
     print("\n" + "=" * 60)
     print("TEST SUMMARY")
     print("=" * 60)
     
+    critical_failures = 0
     for result in TEST_RESULTS:
         status_symbol = "✅" if result["status"] == "PASS" else "❌" if result["status"] == "FAIL" else "⚠️"
         print(f"{status_symbol} {result['test']}: {result['details']}")
+        
+        if result["status"] == "SKIP":
+            skipped += 1
+        elif result["status"] == "FAIL" and any(critical in result["test"] for critical in CRITICAL_TESTS):
+            critical_failures += 1
     
     print(f"\nTotal Tests: {len(TEST_RESULTS)}")
     print(f"Passed: {passed}")
@@ -594,14 +725,11 @@ def run_all_tests():
     print(f"Skipped: {skipped}")
     
     # Determine overall status
-    critical_failures = [r for r in TEST_RESULTS if r["status"] == "FAIL" and 
-                        any(critical in r["test"] for critical in ["Health Check", "Code Generation", "Gemini AI", "Comments"])]
-    
-    if len(critical_failures) == 0:
+    if critical_failures == 0:
         print("\n🎉 BACKEND TESTS: OVERALL PASS")
         return True
     else:
-        print(f"\n💥 BACKEND TESTS: CRITICAL FAILURES DETECTED ({len(critical_failures)})")
+        print(f"\n💥 BACKEND TESTS: CRITICAL FAILURES DETECTED ({critical_failures})")
         return False
 
 if __name__ == "__main__":
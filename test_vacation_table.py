@@ -4,18 +4,45 @@ Test the Vision-to-Code Generator with a vacation request table UI screenshot
 This addresses the specific review request to test with vacation/leave request management table
 """
 
-import requests
 import json
 import base64
 import io
-from PIL import Image, ImageDraw, ImageFont
 import time
+import sys
+import re
+from pathlib import Path
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from tests._http import SESSION, BACKEND_URL, timeout
 
-# Configuration
-BACKEND_URL = "https://abc12f14-f90d-4b88-9143-9c9857f3647b.preview.emergentagent.com/api"
+# Pre-rendered screenshot so runs skip drawing and PNG encoding; rewrite with --regenerate-fixtures
+VACATION_TABLE_FIXTURE = Path(__file__).parent / "tests" / "fixtures" / "vacation_table.png"
 
-def create_vacation_request_table_image():
+# Words expected in the generated component. Each list is one case-insensitive scan; the
+# zero-width lookahead lets overlapping words (e.g. "editable" inside "table") all match
+TABLE_INDICATORS = ['table', 'vacation', 'leave', 'request', 'status', 'approved', 'pending', 'edit', 'revoke']
+REACT_INDICATORS = ['react', 'usestate', 'component', 'jsx', 'props']
+
+def indicator_pattern(words):
+    return re.compile("(?=(" + "|".join(words) + "))", re.IGNORECASE)
+
+TABLE_PATTERN = indicator_pattern(TABLE_INDICATORS)
+REACT_PATTERN = indicator_pattern(REACT_INDICATORS)
+
+def found_words(pattern, words, code):
+    """Indicator words present in code, in list order"""
+    found = {match.group(1).lower() for match in pattern.finditer(code)}
+    return [word for word in words if word in found]
+
+# Screenshot colours for status labels and action buttons (other actions are red)
+STATUS_COLOR = {"Approved": '#27ae60', "Pending": '#f39c12', "Rejected": '#e74c3c'}
+ACTION_COLOR = {"Edit": '#3498db', "View": '#3498db'}
+
+def render_vacation_request_table_image():
     """Create a realistic vacation request table UI screenshot"""
+    # PIL is only needed when the fixture is redrawn with --regenerate-fixtures
+    from PIL import Image, ImageDraw
+    
     # Create a larger image for a proper table layout
     img = Image.new('RGB', (1000, 600), color='#f8f9fa')
     draw = ImageDraw.Draw(img)
@@ -24,17 +51,11 @@ def create_vacation_request_table_image():
     draw.rectangle([0, 0, 1000, 80], fill='#2c3e50', outline='#2c3e50')
     
     # Title
-    try:
-        draw.text((50, 25), "Leave Request Management", fill='white', font=None)
-    except:
-        draw.text((50, 25), "Leave Request Management", fill='white')
+    draw.text((50, 25), "Leave Request Management", fill='white')
     
     # Add New Request button
     draw.rectangle([800, 20, 950, 60], fill='#3498db', outline='#3498db')
-    try:
-        draw.text((820, 35), "Add New Request", fill='white')
-    except:
-        draw.text((820, 35), "Add New Request", fill='white')
+    draw.text((820, 35), "Add New Request", fill='white')
     
     # Table header
     header_y = 100
@@ -45,70 +66,46 @@ def create_vacation_request_table_image():
     header_positions = [70, 200, 400, 650, 800]
     
     for i, header in enumerate(headers):
-        try:
-            draw.text((header_positions[i], header_y + 12), header, fill='white')
-        except:
-            draw.text((header_positions[i], header_y + 12), header, fill='white')
+        draw.text((header_positions[i], header_y + 12), header, fill='white')
     
-    # Table rows
-    rows_data = [
-        ("Vacation", "Dec 20-30, 2024", "Christmas Holiday", "Approved", "Edit | Revoke"),
-        ("Sick Leave", "Jan 15, 2025", "Medical Appointment", "Pending", "Edit | Cancel"),
-        ("Personal", "Feb 10-12, 2025", "Family Event", "Approved", "Edit | Revoke"),
-        ("Vacation", "Mar 5-15, 2025", "Spring Break", "Pending", "Edit | Cancel"),
-        ("Sick Leave", "Jan 8, 2025", "Flu Recovery", "Rejected", "View | Resubmit")
-    ]
+    # Table rows, one list per column
+    types = ["Vacation", "Sick Leave", "Personal", "Vacation", "Sick Leave"]
+    dates = ["Dec 20-30, 2024", "Jan 15, 2025", "Feb 10-12, 2025", "Mar 5-15, 2025", "Jan 8, 2025"]
+    reasons = ["Christmas Holiday", "Medical Appointment", "Family Event", "Spring Break", "Flu Recovery"]
+    statuses = ["Approved", "Pending", "Approved", "Pending", "Rejected"]
+    actions = ["Edit | Revoke", "Edit | Cancel", "Edit | Revoke", "Edit | Cancel", "View | Resubmit"]
     
     row_colors = ['#ffffff', '#f8f9fa']  # Alternating row colors
     
-    for i, row_data in enumerate(rows_data):
-        row_y = header_y + 40 + (i * 50)
+    # Work out every rectangle and label first, then draw each kind in one loop;
+    # no label sits under a later rectangle, so the image is unchanged
+    rects = []
+    labels = []
+    for i, row_y in enumerate(range(header_y + 40, header_y + 40 + len(types) * 50, 50)):
+        rects.append(([50, row_y, 950, row_y + 50], row_colors[i % 2], '#dee2e6'))
         
-        # Row background
-        color = row_colors[i % 2]
-        draw.rectangle([50, row_y, 950, row_y + 50], fill=color, outline='#dee2e6')
+        cells = (types[i], dates[i], reasons[i], statuses[i])
+        cell_colors = ('black', 'black', 'black', STATUS_COLOR.get(statuses[i], 'black'))
+        for x, text, color in zip(header_positions, cells, cell_colors):
+            labels.append(((x, row_y + 15), text, color))
         
-        # Row data
-        for j, cell_data in enumerate(row_data):
-            cell_color = 'black'
-            
-            # Status column coloring
-            if j == 3:  # Status column
-                if cell_data == "Approved":
-                    cell_color = '#27ae60'
-                elif cell_data == "Pending":
-                    cell_color = '#f39c12'
-                elif cell_data == "Rejected":
-                    cell_color = '#e74c3c'
-            
-            # Actions column styling
-            if j == 4:  # Actions column
-                # Draw action buttons
-                actions = cell_data.split(" | ")
-                for k, action in enumerate(actions):
-                    btn_x = header_positions[j] + (k * 60)
-                    btn_color = '#3498db' if action in ['Edit', 'View'] else '#e74c3c'
-                    draw.rectangle([btn_x, row_y + 10, btn_x + 50, row_y + 35], 
-                                 fill=btn_color, outline=btn_color)
-                    try:
-                        draw.text((btn_x + 5, row_y + 18), action, fill='white')
-                    except:
-                        draw.text((btn_x + 5, row_y + 18), action, fill='white')
-            else:
-                try:
-                    draw.text((header_positions[j], row_y + 15), cell_data, fill=cell_color)
-                except:
-                    draw.text((header_positions[j], row_y + 15), cell_data, fill=cell_color)
+        # Action buttons
+        for k, action in enumerate(actions[i].split(" | ")):
+            btn_x = header_positions[4] + (k * 60)
+            btn_color = ACTION_COLOR.get(action, '#e74c3c')
+            rects.append(([btn_x, row_y + 10, btn_x + 50, row_y + 35], btn_color, btn_color))
+            labels.append(((btn_x + 5, row_y + 18), action, 'white'))
+    
+    for box, fill, outline in rects:
+        draw.rectangle(box, fill=fill, outline=outline)
+    for xy, text, color in labels:
+        draw.text(xy, text, fill=color)
     
     # Footer with pagination
     footer_y = 500
     draw.rectangle([50, footer_y, 950, footer_y + 50], fill='#ecf0f1', outline='#bdc3c7')
-    try:
-        draw.text((70, footer_y + 15), "Showing 1-5 of 12 requests", fill='#7f8c8d')
-        draw.text((800, footer_y + 15), "< Previous | Next >", fill='#3498db')
-    except:
-        draw.text((70, footer_y + 15), "Showing 1-5 of 12 requests", fill='#7f8c8d')
-        draw.text((800, footer_y + 15), "< Previous | Next >", fill='#3498db')
+    draw.text((70, footer_y + 15), "Showing 1-5 of 12 requests", fill='#7f8c8d')
+    draw.text((800, footer_y + 15), "< Previous | Next >", fill='#3498db')
     
     # Convert to bytes
     img_byte_arr = io.BytesIO()
@@ -117,8 +114,20 @@ def create_vacation_request_table_image():
     
     return img_byte_arr.getvalue()
 
+def regenerate_vacation_table_fixture():
+    """Redraw the vacation table screenshot and save it as the fixture"""
+    image_bytes = render_vacation_request_table_image()
+    VACATION_TABLE_FIXTURE.parent.mkdir(parents=True, exist_ok=True)
+    VACATION_TABLE_FIXTURE.write_bytes(image_bytes)
+    return image_bytes
+
+@lru_cache(maxsize=1)
+def create_vacation_request_table_image():
+    """Vacation request table screenshot, loaded from the committed fixture"""
+    return VACATION_TABLE_FIXTURE.read_bytes()
+
 def test_vacation_table_code_generation():
-    """Test code generation with vacation request table screenshot"""
+    """Test code generation with vacation request table screenshot, returning (success, session_id, code)"""
     print("=" * 60)
     print("TESTING VACATION REQUEST TABLE CODE GENERATION")
     print("=" * 60)
@@ -140,11 +149,11 @@ def test_vacation_table_code_generation():
         print("🚀 Sending request to /api/upload-and-generate...")
         print(f"📝 Comments: {data['comments']}")
         
-        response = requests.post(
+        response = SESSION.post(
             f"{BACKEND_URL}/upload-and-generate",
             files=files,
             data=data,
-            timeout=45  # Longer timeout for complex image
+            timeout=timeout(45)  # Longer timeout for complex image
         )
         
         if response.status_code == 200:
@@ -156,15 +165,12 @@ def test_vacation_table_code_generation():
             print(f"💬 Comments processed: {result['comments']}")
             
             # Check if the generated code contains vacation/table related elements
-            code_lower = result['code'].lower()
-            table_indicators = ['table', 'vacation', 'leave', 'request', 'status', 'approved', 'pending', 'edit', 'revoke']
-            found_indicators = [word for word in table_indicators if word in code_lower]
+            found_indicators = found_words(TABLE_PATTERN, TABLE_INDICATORS, result['code'])
             
             print(f"🔍 Table-related elements found in code: {found_indicators}")
             
             # Check for React-specific elements
-            react_indicators = ['react', 'usestate', 'component', 'jsx', 'props']
-            found_react = [word for word in react_indicators if word in code_lower]
+            found_react = found_words(REACT_PATTERN, REACT_INDICATORS, result['code'])
             print(f"⚛️ React elements found in code: {found_react}")
             
             # Save a sample of the generated code
@@ -175,47 +181,46 @@ def test_vacation_table_code_generation():
             
             if len(found_indicators) >= 3 and len(found_react) >= 2:
                 print("🎉 EXCELLENT: AI successfully generated vacation table React component!")
-                return True
+                return True, result['session_id'], result['code']
             elif len(found_indicators) >= 2:
                 print("✅ GOOD: AI generated table-related code with some vacation elements")
-                return True
+                return True, result['session_id'], result['code']
             else:
                 print("⚠️ PARTIAL: AI generated code but may not fully match vacation table requirements")
-                return True
+                return True, result['session_id'], result['code']
                 
         else:
             print(f"❌ FAILED: HTTP {response.status_code}")
             print(f"Error: {response.text}")
-            return False
+            return False, None, None
             
     except Exception as e:
         print(f"❌ ERROR: {str(e)}")
-        return False
+        return False, None, None
+
+def send_chat(session_id, message, current_code):
+    """Send one chat request"""
+    chat_data = {
+        "session_id": session_id,
+        "message": message,
+        "current_code": current_code
+    }
+    
+    return SESSION.post(
+        f"{BACKEND_URL}/chat",
+        json=chat_data,
+        headers={'Content-Type': 'application/json'},
+        timeout=timeout(30)
+    )
 
-def test_chat_with_vacation_table():
-    """Test chat functionality for vacation table modifications"""
+def test_chat_with_vacation_table(session_id, code):
+    """Test chat functionality for vacation table modifications on the session from the generation test"""
     print("\n" + "=" * 60)
     print("TESTING CHAT FUNCTIONALITY WITH VACATION TABLE")
     print("=" * 60)
     
-    # First generate a vacation table
-    vacation_image = create_vacation_request_table_image()
-    
-    files = {
-        'file': ('vacation_table.png', vacation_image, 'image/png')
-    }
-    data = {
-        'technology': 'react',
-        'comments': 'Simple vacation request table'
-    }
-    
-    # Generate initial code
-    response = requests.post(f"{BACKEND_URL}/upload-and-generate", files=files, data=data, timeout=30)
-    
-    if response.status_code == 200:
-        result = response.json()
-        session_id = result['session_id']
-        print(f"✅ Initial code generated, session: {session_id}")
+    if session_id:
+        print(f"✅ Reusing generated vacation table, session: {session_id}")
         
         # Test chat modifications
         chat_requests = [
@@ -224,29 +229,22 @@ def test_chat_with_vacation_table():
             "Add a date picker for filtering requests by date range"
         ]
         
-        for i, chat_message in enumerate(chat_requests, 1):
+        # Every request sends the initially generated code as current_code, so each reply
+        # stands on its own and they can be sent together. Only the replies are checked:
+        # the session's stored generated_code ends up as whichever reply is saved last.
+        with ThreadPoolExecutor(max_workers=len(chat_requests)) as executor:
+            chat_responses = list(executor.map(lambda message: send_chat(session_id, message, code or ''), chat_requests))
+        
+        for i, (chat_message, chat_response) in enumerate(zip(chat_requests, chat_responses), 1):
             print(f"\n🗨️ Chat Request {i}: {chat_message}")
             
-            chat_data = {
-                "session_id": session_id,
-                "message": chat_message,
-                "current_code": result.get('code', '')
-            }
-            
-            chat_response = requests.post(
-                f"{BACKEND_URL}/chat",
-                json=chat_data,
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
-            
             if chat_response.status_code == 200:
-                chat_result = chat_response.json()
-                print(f"✅ AI Response: {len(chat_result['response'])} characters")
+                reply = chat_response.json()['response']
+                print(f"✅ AI Response: {len(reply)} characters")
                 
-                # Check if response contains relevant modifications
-                response_lower = chat_result['response'].lower()
-                if any(word in response_lower for word in chat_message.lower().split()):
+                # Check if response contains relevant modifications (any word of the request)
+                request_words_re = re.compile("|".join(map(re.escape, chat_message.split())), re.IGNORECASE)
+                if request_words_re.search(reply):
                     print("🎯 AI understood and addressed the request")
                 else:
                     print("⚠️ AI response may not fully address the request")
@@ -257,15 +255,20 @@ def test_chat_with_vacation_table():
         print("🎉 Chat functionality working with vacation table context!")
         return True
     else:
-        print("❌ Failed to generate initial vacation table code")
+        print("❌ No vacation table session available from code generation")
         return False
 
 if __name__ == "__main__":
+    if "--regenerate-fixtures" in sys.argv:
+        regenerate_vacation_table_fixture()
+        print(f"🖼️ Regenerated {VACATION_TABLE_FIXTURE}")
+    
     print("🧪 COMPREHENSIVE VACATION REQUEST TABLE TESTING")
     print("Testing the specific use case mentioned in the review request\n")
     
-    success1 = test_vacation_table_code_generation()
-    success2 = test_chat_with_vacation_table()
+    # The chat test edits the session generated here instead of uploading again
+    success1, session_id, code = test_vacation_table_code_generation()
+    success2 = test_chat_with_vacation_table(session_id, code)
     
     print("\n" + "=" * 60)
     print("FINAL RESULTS")
@@ -0,0 +1,53 @@
+"""
+HTTP client shared by the backend test scripts
+One pooled keep-alive client, so scripts run in the same process reuse connections
+"""
+
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+BACKEND_URL = os.environ.get(
+    "BACKEND_URL",
+    "https://abc12f14-f90d-4b88-9143-9c9857f3647b.preview.emergentagent.com/api"
+).rstrip("/")
+
+# Connection attempts fail fast; each call sets its own read timeout for the reply
+CONNECT_TIMEOUT = 3.05
+
+# One keep-alive client so the TLS handshake happens once, not per request.
+# With httpx[http2] installed, concurrent tests share one multiplexed HTTP/2 connection;
+# otherwise fall back to a pooled requests session (both accept the same call arguments).
+# Both clients retry only failed connects, so a POST that reached the server
+# (upload-and-generate, chat) is never sent twice.
+try:
+    import httpx
+    SESSION = httpx.Client(transport=httpx.HTTPTransport(
+        http2=True,
+        retries=3,
+        limits=httpx.Limits(max_connections=20)
+    ))
+except ImportError:
+    httpx = None
+    SESSION = requests.Session()
+    _adapter = HTTPAdapter(
+        pool_connections=20,
+        pool_maxsize=20,
+        max_retries=Retry(
+            total=3,
+            connect=3,
+            read=0,
+            status=0,
+            backoff_factor=0.3
+        )
+    )
+    SESSION.mount("http://", _adapter)
+    SESSION.mount("https://", _adapter)
+
+def timeout(read):
+    """(connect, read) timeout for a SESSION call, in the form the active client expects"""
+    if httpx is not None:
+        return httpx.Timeout(read, connect=CONNECT_TIMEOUT)
+    return (CONNECT_TIMEOUT, read)
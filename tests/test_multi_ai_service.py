@@ -0,0 +1,96 @@
+"""
+Retry and circuit breaker behaviour of MultiAIService._generate_with_single_model
+Runs without network access; the provider call is replaced per test
+"""
+
+import asyncio
+import importlib.util
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+HAS_LLM_CLIENT = importlib.util.find_spec("emergentintegrations") is not None
+
+if HAS_LLM_CLIENT:
+    from ai_models import multi_ai_service
+    from ai_models.multi_ai_service import GenerationResult, ModelType, MultiAIService
+
+class ProviderError(Exception):
+    """Client error carrying an HTTP status, like the LLM client's API errors"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+@unittest.skipUnless(HAS_LLM_CLIENT, "emergentintegrations is not installed")
+class SingleModelRetryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.service = MultiAIService()
+        self.config = self.service.models[ModelType.GEMINI_FLASH]
+        self.calls = 0
+        # Let every call through the rate limiter immediately
+        self.service._wait_for_rate_limit = self._no_wait
+
+    async def _no_wait(self, model_config, enhanced_prompt):
+        return None
+
+    def _fail_with(self, error):
+        async def dispatch(*args):
+            self.calls += 1
+            raise error
+        self.service._dispatch_to_provider = dispatch
+
+    def _generate(self):
+        return asyncio.run(self.service._generate_with_single_model(
+            self.config, "prompt", "react", None, None, "enhanced prompt", "session"
+        ))
+
+    def _state(self):
+        return self.service._provider_state[self.config.provider]
+
+    def test_client_errors_are_not_retried_or_counted(self):
+        errors = [
+            ProviderError("invalid api key", status_code=401),
+            ProviderError("permission denied", status_code=403),
+            ProviderError("bad request", status_code=400),
+            ProviderError("AuthenticationError: 401 API key not valid"),
+        ]
+        for error in errors:
+            with self.subTest(error=str(error)):
+                self.calls = 0
+                self._fail_with(error)
+                result = self._generate()
+                self.assertFalse(result.success)
+                self.assertEqual(self.calls, 1)
+                self.assertEqual(self._state()["failures"], [])
+                self.assertIsNone(self._state()["opened_at"])
+
+    def test_server_errors_are_retried_and_counted(self):
+        self._fail_with(ProviderError("service unavailable", status_code=503))
+        # Skip the backoff sleep between attempts
+        with mock.patch.object(multi_ai_service.asyncio, "sleep", mock.AsyncMock()):
+            result = self._generate()
+
+        self.assertFalse(result.success)
+        self.assertEqual(self.calls, multi_ai_service.MAX_GENERATION_ATTEMPTS)
+        self.assertEqual(len(self._state()["failures"]), multi_ai_service.MAX_GENERATION_ATTEMPTS)
+
+    def test_success_resets_failures(self):
+        async def dispatch(*args):
+            return GenerationResult(
+                model_type=self.config.model_type,
+                provider=self.config.provider,
+                success=True,
+                code="const App = () => null;"
+            )
+        self.service._dispatch_to_provider = dispatch
+        self._state()["failures"] = [0.0]
+        self.assertTrue(self._generate().success)
+        self.assertEqual(self._state()["failures"], [])
+
+if __name__ == "__main__":
+    unittest.main()